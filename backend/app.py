@@ -1,12 +1,19 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from starlette.staticfiles import StaticFiles
-from backend.db.database import init_db
+from backend.db.database import init_db, close_db
+from backend.db.writer import start_writer, stop_writer
+from backend.services.ingest import OUILookup
 from backend.routers.upload import router as upload_router
 from backend.routers.networks import router as networks_router
 from backend.routers.wpasec import router as wpasec_router
 
-app = FastAPI(title="pwnmap", version="2.0.0")
+app = FastAPI(title="pwnmap", version="2.0.0", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -22,7 +29,24 @@ app.include_router(wpasec_router)
 
 @app.on_event("startup")
 async def _startup() -> None:
+    # asyncio.to_thread (conversione pcap, salvataggio upload) usa l'executor di default;
+    # le scritture sul DB hanno un thread dedicato, così si serializzano da sole.
+    app.state.pcap_executor = ThreadPoolExecutor(
+        max_workers=(os.cpu_count() or 1) * 2, thread_name_prefix="pcap"
+    )
+    asyncio.get_running_loop().set_default_executor(app.state.pcap_executor)
+    app.state.db_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+
     init_db()
+    start_writer(app.state.db_write_executor)
+    await asyncio.to_thread(OUILookup.preload)
+
+@app.on_event("shutdown")
+async def _shutdown() -> None:
+    await stop_writer()
+    app.state.db_write_executor.shutdown(wait=True)
+    app.state.pcap_executor.shutdown(wait=False)
+    close_db()
 
 @app.get("/healthz")
 async def healthz():
@@ -1,3 +1,4 @@
+import hmac
 import logging
 
 from fastapi import Depends, HTTPException, status, Header
@@ -6,17 +7,15 @@ from backend.core.settings import settings
 
 bearer_scheme = HTTPBearer(auto_error=False)
 
+# Header atteso per intero; confrontato in tempo costante
+_EXPECTED = ("Bearer " + settings.auth_token).encode() if settings.auth_token else None
+
 def require_admin(authorization: str = Header(None)):
     if not authorization:
         logging.info("auth: missing Authorization header")
         raise HTTPException(status_code=401, detail="Missing Authorization header")
 
-    if not authorization.startswith("Bearer "):
-        logging.info("auth: bad schema: %s", authorization.split()[0] if authorization else None)
-        raise HTTPException(status_code=401, detail="Use Bearer token")
-
-    token = authorization.split(None, 1)[1]
-    if token != settings.auth_token:
+    if _EXPECTED is None or not hmac.compare_digest(authorization.encode(), _EXPECTED):
         logging.info("auth: invalid token")
         raise HTTPException(status_code=403, detail="Invalid token")
 
@@ -19,11 +19,18 @@ class Settings(BaseSettings):
     # WPA-SEC
     wpasec_url: str             # PWNMAP_WPASEC_URL
     wpasec_key: str             # PWNMAP_WPASEC_KEY
+    wpasec_backoff_base: float = 1.0    # PWNMAP_WPASEC_BACKOFF_BASE (secondi)
+    wpasec_backoff_max: float = 30.0    # PWNMAP_WPASEC_BACKOFF_MAX (secondi)
+    wpasec_backoff_jitter: float = 0.5  # PWNMAP_WPASEC_BACKOFF_JITTER (frazione, ±)
 
     # Paths
     data_dir: Path              # PWNMAP_DATA_DIR
     db_path: Path               # PWNMAP_DB_PATH
     vendor_oui_csv: Path        # PWNMAP_VENDOR_OUI_CSV
+    wpasec_cache_file: Path | None = None  # PWNMAP_WPASEC_CACHE_FILE (default: data_dir/wpasec_cache.json)
+
+    # SQLite
+    db_read_connections: int = 4  # PWNMAP_DB_READ_CONNECTIONS
 
     def model_post_init(self, __context) -> None:
         # Normalizza percorsi in assoluto e crea le cartelle se mancano
@@ -35,6 +42,9 @@ class Settings(BaseSettings):
             db_path = (Path.cwd() / db_path).resolve()
         if not vendor_csv.is_absolute():
             vendor_csv = (Path.cwd() / vendor_csv).resolve()
+        wpasec_cache = Path(self.wpasec_cache_file) if self.wpasec_cache_file else data_dir / "wpasec_cache.json"
+        if not wpasec_cache.is_absolute():
+            wpasec_cache = (Path.cwd() / wpasec_cache).resolve()
 
         data_dir.mkdir(parents=True, exist_ok=True)
         db_path.parent.mkdir(parents=True, exist_ok=True)
@@ -43,5 +53,6 @@ class Settings(BaseSettings):
         object.__setattr__(self, "data_dir", data_dir)
         object.__setattr__(self, "db_path", db_path)
         object.__setattr__(self, "vendor_oui_csv", vendor_csv)
+        object.__setattr__(self, "wpasec_cache_file", wpasec_cache)
 
 settings = Settings()
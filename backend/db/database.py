@@ -1,8 +1,13 @@
+import itertools
+import logging
 import sqlite3
+import threading
 from pathlib import Path
 from contextlib import contextmanager
 from backend.core.settings import settings
 
+log = logging.getLogger(__name__)
+
 SCHEMA_SQL = """
 CREATE TABLE IF NOT EXISTS networks (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -10,6 +15,7 @@ CREATE TABLE IF NOT EXISTS networks (
     -- ordine richiesto
     ssid         TEXT,
     bssid        TEXT,
+    bssid_norm   TEXT,   -- bssid maiuscolo senza ':'/'-', calcolato all'insert
     vendor       TEXT,
     date         TEXT,   -- "YYYY-MM-DD"
     time         TEXT,   -- "HH:MM:SS"
@@ -29,27 +35,162 @@ CREATE TABLE IF NOT EXISTS networks (
 -- Useful indexes for filters
 CREATE INDEX IF NOT EXISTS idx_networks_coords       ON networks(lat, lon);
 CREATE INDEX IF NOT EXISTS idx_networks_bssid        ON networks(bssid);
+CREATE INDEX IF NOT EXISTS idx_networks_bssid_norm   ON networks(bssid_norm);
 CREATE INDEX IF NOT EXISTS idx_networks_date_time    ON networks(date, time);
 CREATE INDEX IF NOT EXISTS idx_networks_ssid         ON networks(ssid);
 CREATE INDEX IF NOT EXISTS idx_networks_password     ON networks(password);
 """
 
-def init_db() -> None:
-    Path("data").mkdir(parents=True, exist_ok=True)
-    dbp: Path = settings.db_path
-    dbp.parent.mkdir(parents=True, exist_ok=True)
-    with sqlite3.connect(dbp) as conn:
-        conn.executescript(SCHEMA_SQL)
-        conn.commit()
+# Indice full-text (trigram) su ssid/vendor/bssid per la ricerca "q",
+# tenuto allineato a networks dai trigger.
+FTS_SQL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS networks_fts USING fts5(
+    ssid, vendor, bssid,
+    content='networks', content_rowid='id', tokenize='trigram'
+);
 
-@contextmanager
-def db_conn():
+CREATE TRIGGER IF NOT EXISTS networks_fts_ai AFTER INSERT ON networks BEGIN
+    INSERT INTO networks_fts(rowid, ssid, vendor, bssid)
+    VALUES (new.id, new.ssid, new.vendor, new.bssid);
+END;
+
+CREATE TRIGGER IF NOT EXISTS networks_fts_ad AFTER DELETE ON networks BEGIN
+    INSERT INTO networks_fts(networks_fts, rowid, ssid, vendor, bssid)
+    VALUES ('delete', old.id, old.ssid, old.vendor, old.bssid);
+END;
+
+CREATE TRIGGER IF NOT EXISTS networks_fts_au AFTER UPDATE OF ssid, vendor, bssid ON networks BEGIN
+    INSERT INTO networks_fts(networks_fts, rowid, ssid, vendor, bssid)
+    VALUES ('delete', old.id, old.ssid, old.vendor, old.bssid);
+    INSERT INTO networks_fts(rowid, ssid, vendor, bssid)
+    VALUES (new.id, new.ssid, new.vendor, new.bssid);
+END;
+"""
+
+# PRAGMA per-connessione (journal_mode=WAL è persistente sul file)
+PRAGMAS_SQL = """
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous  = NORMAL;
+PRAGMA temp_store   = MEMORY;
+PRAGMA cache_size   = -64000;
+PRAGMA mmap_size    = 268435456;
+"""
+
+# Una connessione RW condivisa (serializzata da _RW_LOCK) + N connessioni RO.
+_RW_CONN: sqlite3.Connection | None = None
+_RW_LOCK = threading.Lock()
+_RO_CONNS: list[tuple[sqlite3.Connection, threading.Lock]] = []
+_RO_NEXT = itertools.count()
+_INIT_LOCK = threading.Lock()
+_FTS_ENABLED = False
+
+
+MIGRATION_SQL = """
+UPDATE networks
+   SET bssid_norm = REPLACE(REPLACE(UPPER(TRIM(bssid)), ':', ''), '-', '')
+ WHERE bssid_norm IS NULL AND bssid IS NOT NULL;
+"""
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    """Aggiunge le colonne mancanti ai DB creati con uno schema precedente."""
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(networks)")}
+    if cols and "bssid_norm" not in cols:
+        conn.execute("ALTER TABLE networks ADD COLUMN bssid_norm TEXT")
+
+
+def _init_fts(conn: sqlite3.Connection) -> bool:
+    """Crea networks_fts (e la popola se nuova). False se FTS5/trigram non disponibile."""
+    existed = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'networks_fts'"
+    ).fetchone()
+    try:
+        conn.executescript(FTS_SQL)
+    except sqlite3.OperationalError as e:
+        log.warning("FTS5 trigram non disponibile, ricerca con LIKE: %s", e)
+        return False
+    if not existed:
+        conn.execute("INSERT INTO networks_fts(networks_fts) VALUES ('rebuild')")
+    return True
+
+
+def fts_enabled() -> bool:
+    return _FTS_ENABLED
+
+
+def _connect(database: str | Path, *, uri: bool = False) -> sqlite3.Connection:
     conn = sqlite3.connect(
-        settings.db_path,
+        database,
+        uri=uri,
+        check_same_thread=False,
+        cached_statements=256,
         detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
     )
     conn.row_factory = sqlite3.Row
-    try:
+    conn.executescript(PRAGMAS_SQL)
+    return conn
+
+
+def init_db() -> None:
+    global _RW_CONN, _FTS_ENABLED
+    with _INIT_LOCK:
+        if _RW_CONN is not None:
+            return
+        Path("data").mkdir(parents=True, exist_ok=True)
+        dbp: Path = settings.db_path
+        dbp.parent.mkdir(parents=True, exist_ok=True)
+
+        rw = _connect(dbp)
+        _migrate(rw)
+        rw.executescript(SCHEMA_SQL)
+        rw.executescript(MIGRATION_SQL)
+        _FTS_ENABLED = _init_fts(rw)
+        rw.commit()
+
+        ro_uri = f"{dbp.as_uri()}?mode=ro"
+        _RO_CONNS[:] = [
+            (_connect(ro_uri, uri=True), threading.Lock())
+            for _ in range(max(1, settings.db_read_connections))
+        ]
+        _RW_CONN = rw
+
+
+def close_db() -> None:
+    global _RW_CONN
+    with _INIT_LOCK:
+        for conn, lock in _RO_CONNS:
+            with lock:
+                conn.close()
+        _RO_CONNS.clear()
+        if _RW_CONN is not None:
+            with _RW_LOCK:
+                # aggiorna le statistiche (sqlite_stat1) usate dal planner per
+                # scegliere tra idx_networks_coords e idx_networks_date_time
+                _RW_CONN.execute("PRAGMA optimize")
+                _RW_CONN.close()
+            _RW_CONN = None
+
+
+@contextmanager
+def db_conn(write: bool = False):
+    """
+    Restituisce una connessione persistente.
+    write=True: la connessione RW condivisa, in esclusiva finché il blocco è aperto
+    (commit/rollback a carico del chiamante).
+    write=False: una delle connessioni read-only, a rotazione.
+    """
+    if _RW_CONN is None:
+        init_db()
+
+    if write:
+        with _RW_LOCK:
+            try:
+                yield _RW_CONN
+            except BaseException:
+                _RW_CONN.rollback()
+                raise
+        return
+
+    conn, lock = _RO_CONNS[next(_RO_NEXT) % len(_RO_CONNS)]
+    with lock:
         yield conn
-    finally:
-        conn.close()
\ No newline at end of file
@@ -2,11 +2,84 @@ from __future__ import annotations
 
 import logging
 import sqlite3
-from typing import Optional, Iterable
-from backend.core.settings import settings
+from functools import lru_cache
+from typing import Optional, Iterable, Iterator
+
+import orjson
+
+from backend.db.database import db_conn, fts_enabled
 
 log = logging.getLogger(__name__)
 
+# feature serializzate per ogni chunk della risposta GeoJSON
+_GEOJSON_FETCH_ROWS = 500
+# colonne lette per la GeoJSON, nell'ordine delle properties; lat/lon seguono in coda
+_GEOJSON_PROPS = (
+    "id", "ssid", "bssid", "vendor", "date", "time", "hash_type", "hash_variant",
+    "alt", "accuracy", "password",
+)
+
+def _norm_bssid(bssid: str) -> str:
+    """'aa:bb-cc...' -> 'AABBCC...' (valore della colonna bssid_norm)."""
+    return bssid.strip().upper().replace(":", "").replace("-", "")
+
+
+_INSERT_SQL = """
+INSERT OR IGNORE INTO networks (
+    ssid, bssid, bssid_norm, vendor,
+    date, time,
+    hash_type, hash_variant,
+    lat, lon, alt, accuracy,
+    password
+)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def _insert_row(cur: sqlite3.Cursor, row: dict) -> int:
+    bssid = row["bssid"]; date = row["date"]; time = row["time"]
+    cur.execute(
+        _INSERT_SQL,
+        (
+            row["ssid"],
+            bssid,
+            _norm_bssid(bssid) if bssid is not None else None,
+            row["vendor"],
+            date,
+            time,
+            row["hash_type"],
+            row["hash_variant"],
+            row["lat"],
+            row["lon"],
+            row["alt"],
+            row["accuracy"],
+            row["password"],
+        ),
+    )
+    # lastrowid non viene azzerato da un IGNORE sulla connessione persistente
+    if cur.rowcount == 1:
+        return int(cur.lastrowid)
+
+    if bssid is not None:
+        # significa che ha ignorato perché era un duplicato
+        cur.execute(
+            "SELECT id FROM networks WHERE bssid = ? AND date = ? AND time = ?",
+            (bssid, date, time),
+        )
+        found = cur.fetchone()
+        if found:
+            log.warning(
+                "Record duplicato ignorato per BSSID=%s @ %s %s (id esistente=%s)",
+                bssid, date, time, found["id"]
+            )
+            return int(found["id"])
+
+    log.warning(
+        "Insert fallito senza motivo apparente per BSSID=%s @ %s %s",
+        bssid, date, time
+    )
+    return -1
+
+
 def insert_network_record(
     *,
     ssid: Optional[str],
@@ -26,112 +99,92 @@ def insert_network_record(
     Inserisce una riga in 'networks'. Ritorna l'id inserito (o esistente se UNIQUE).
     UNIQUE su (bssid, date, time). Se bssid è NULL non scatta, è voluto.
     """
+    row = dict(
+        ssid=ssid, hash_type=hash_type, hash_variant=hash_variant,
+        bssid=bssid, vendor=vendor, date=date, time=time,
+        lat=lat, lon=lon, alt=alt, accuracy=accuracy, password=password,
+    )
+    return insert_network_records([row])[0]
 
-    try:
-        with sqlite3.connect(settings.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cur = conn.cursor()
 
-            cur.execute(
-                """
-                INSERT OR IGNORE INTO networks (
-                    ssid, bssid, vendor,
-                    date, time,
-                    hash_type, hash_variant,
-                    lat, lon, alt, accuracy,
-                    password
-                )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    ssid,
-                    bssid,
-                    vendor,
-                    date,
-                    time,
-                    hash_type,
-                    hash_variant,
-                    lat,
-                    lon,
-                    alt,
-                    accuracy,
-                    password,
-                ),
-            )
-            new_id = cur.lastrowid
-
-            if not new_id and bssid is not None:
-                # significa che ha ignorato perché era un duplicato
-                cur.execute(
-                    "SELECT id FROM networks WHERE bssid = ? AND date = ? AND time = ?",
-                    (bssid, date, time),
-                )
-                row = cur.fetchone()
-                if row:
-                    log.warning(
-                        "Record duplicato ignorato per BSSID=%s @ %s %s (id esistente=%s)",
-                        bssid, date, time, row["id"]
-                    )
-                    return int(row["id"])
-                else:
-                    log.warning(
-                        "Insert fallito senza motivo apparente per BSSID=%s @ %s %s",
-                        bssid, date, time
-                    )
-                    return -1
+def insert_network_records(rows: list[dict]) -> list[int]:
+    """
+    Inserisce un batch di righe (stesse chiavi di insert_network_record)
+    in un'unica transazione. Ritorna gli id nello stesso ordine, -1 se fallito.
+    """
+    if not rows:
+        return []
 
+    try:
+        with db_conn(write=True) as conn:
+            cur = conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            ids = [_insert_row(cur, row) for row in rows]
             conn.commit()
-            return int(new_id)
+            return ids
 
     except sqlite3.Error as e:
-        log.exception("Errore SQLite durante insert_network_record: %s", e)
-        return -1
+        log.exception("Errore SQLite durante insert_network_records: %s", e)
+        return [-1] * len(rows)
 
 def bulk_update_passwords(items: Iterable[tuple[str, str]]) -> int:
     """Aggiorna solo reti già presenti con password NULL/vuota."""
-    import sqlite3
-    from backend.core.settings import settings
-
     if not items:
         return 0
 
-    updated = 0
-    with sqlite3.connect(settings.db_path) as conn:
+    # a parità di BSSID vince la prima password, come nel vecchio UPDATE riga per riga
+    rows = [(_norm_bssid(bssid), pwd) for bssid, pwd in items if bssid and pwd]
+    if not rows:
+        return 0
+
+    with db_conn(write=True) as conn:
         cur = conn.cursor()
-        for bssid, pwd in items:
-            if not bssid or not pwd:
-                continue
-            cur.execute(
-                """
-                UPDATE networks
-                   SET password = ?
-                 WHERE REPLACE(REPLACE(UPPER(TRIM(bssid)), ':',''), '-', '') =
-                       REPLACE(REPLACE(UPPER(TRIM(?)),      ':',''), '-', '')
-                   AND (password IS NULL OR TRIM(password) = '')
-                """,
-                (pwd, bssid),
-            )
-            updated += cur.rowcount
+        cur.execute("BEGIN")
+        cur.execute("CREATE TEMP TABLE IF NOT EXISTS pw_updates (bssid_norm TEXT PRIMARY KEY, pwd TEXT)")
+        cur.execute("DELETE FROM pw_updates")
+        cur.executemany("INSERT OR IGNORE INTO pw_updates (bssid_norm, pwd) VALUES (?, ?)", rows)
+        cur.execute(
+            """
+            UPDATE networks
+               SET password = (
+                       SELECT pwd FROM pw_updates
+                        WHERE pw_updates.bssid_norm = networks.bssid_norm
+                   )
+             WHERE bssid_norm IN (SELECT bssid_norm FROM pw_updates)
+               AND (password IS NULL OR TRIM(password) = '')
+            """
+        )
+        updated = cur.rowcount
+        cur.execute("DELETE FROM pw_updates")
         conn.commit()
     return updated
 
+def max_network_id() -> int:
+    """Id più alto in networks (0 se vuota): cambia a ogni nuova rete inserita."""
+    # letto sulla connessione RW: vede sempre l'ultimo commit, qualunque snapshot
+    # tengano aperto le connessioni RO
+    with db_conn(write=True) as conn:
+        row = conn.execute("SELECT COALESCE(MAX(id), 0) FROM networks").fetchone()
+    return int(row[0])
 
-def select_networks_geojson(
-    *,
-    bbox: Optional[tuple[float, float, float, float]] = None,  # (minLon,minLat,maxLon,maxLat)
-    cracked: Optional[bool] = None,
-    has_bssid: Optional[bool] = None,
-    q: Optional[str] = None,
-    limit: int = 5000,
-) -> dict:
-    parts = ["SELECT id, ssid, bssid, vendor, date, time, hash_type, hash_variant, lat, lon, alt, accuracy, password FROM networks"]
+
+@lru_cache(maxsize=32)
+def _build_geojson_sql(
+    has_bbox: bool,
+    cracked: Optional[bool],
+    has_bssid: Optional[bool],
+    q_mode: Optional[str],
+) -> str:
+    """SQL per select_networks_geojson, uno per combinazione di filtri attivi.
+
+    Il testo identico per ogni forma permette a sqlite3 di riusare lo statement
+    già preparato dalla propria cache (cached_statements).
+    """
+    parts = ["SELECT " + ", ".join(_GEOJSON_PROPS) + ", lat, lon FROM networks"]
     where = []
-    params: list = []
 
-    if bbox is not None:
-        (min_lon, min_lat, max_lon, max_lat) = bbox
+    if has_bbox:
         where.append("lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?")
-        params += [min_lat, max_lat, min_lon, max_lon]
 
     if cracked is True:
         where.append("password IS NOT NULL AND TRIM(password) != ''")
@@ -143,45 +196,86 @@ def select_networks_geojson(
     elif has_bssid is False:
         where.append("(bssid IS NULL OR TRIM(bssid) = '')")
 
-    if q:
+    if q_mode == "fts":
+        where.append("id IN (SELECT rowid FROM networks_fts WHERE networks_fts MATCH ?)")
+    elif q_mode == "like":
         where.append("(ssid LIKE ? OR vendor LIKE ? OR bssid LIKE ?)")
-        like = f"%{q}%"
-        params += [like, like, like]
 
     if where:
         parts.append("WHERE " + " AND ".join(where))
 
     parts.append("ORDER BY date DESC, time DESC")
     parts.append("LIMIT ?")
+
+    return "\n".join(parts)
+
+
+def select_networks_geojson(
+    *,
+    bbox: Optional[tuple[float, float, float, float]] = None,  # (minLon,minLat,maxLon,maxLat)
+    cracked: Optional[bool] = None,
+    has_bssid: Optional[bool] = None,
+    q: Optional[str] = None,
+    limit: int = 5000,
+) -> Iterator[bytes]:
+    """
+    FeatureCollection GeoJSON a pezzi (bytes). Le righe (tuple, al massimo limit)
+    si leggono tutte subito e il cursore si chiude prima di restituire il
+    generatore: un errore del DB arriva al chiamante prima che la risposta sia
+    iniziata, e la connessione RO condivisa non resta con una transazione di
+    lettura aperta (snapshot vecchio per gli altri, checkpoint WAL bloccato)
+    mentre il client legge. Le feature si serializzano a blocchi.
+    """
+    params: list = []
+
+    if bbox is not None:
+        (min_lon, min_lat, max_lon, max_lat) = bbox
+        params += [min_lat, max_lat, min_lon, max_lon]
+
+    q_mode = None
+    if q:
+        # il tokenizer trigram trova sottostringhe di almeno 3 caratteri
+        if len(q) >= 3 and fts_enabled():
+            q_mode = "fts"
+            params.append('"' + q.replace('"', '""') + '"')
+        else:
+            q_mode = "like"
+            like = f"%{q}%"
+            params += [like, like, like]
+
     params.append(int(limit))
 
-    sql = "\n".join(parts)
+    sql = _build_geojson_sql(bbox is not None, cracked, has_bssid, q_mode)
 
-    features = []
-    with sqlite3.connect(settings.db_path) as conn:
-        conn.row_factory = sqlite3.Row
+    with db_conn() as conn:
         cur = conn.cursor()
-        for row in cur.execute(sql, params):
-            lat = row["lat"]; lon = row["lon"]
-            if lat is None or lon is None:
-                continue
-            props = {
-                "id": row["id"],
-                "ssid": row["ssid"],
-                "bssid": row["bssid"],
-                "vendor": row["vendor"],
-                "date": row["date"],
-                "time": row["time"],
-                "hash_type": row["hash_type"],
-                "hash_variant": row["hash_variant"],
-                "alt": row["alt"],
-                "accuracy": row["accuracy"],
-                "password": row["password"],
-            }
-            features.append({
-                "type": "Feature",
-                "geometry": {"type": "Point", "coordinates": [lon, lat]},
-                "properties": props,
-            })
+        cur.row_factory = None  # tuple: le property si ricavano con zip()
+        try:
+            rows = cur.execute(sql, params).fetchall()
+        finally:
+            cur.close()
+    return _geojson_chunks(rows)
 
-    return {"type": "FeatureCollection", "features": features}
+
+def _geojson_chunks(rows: list) -> Iterator[bytes]:
+    yield b'{"type":"FeatureCollection","features":['
+    first = True
+    for i in range(0, len(rows), _GEOJSON_FETCH_ROWS):
+        feats = [
+            {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": (r[12], r[11])},
+                "properties": dict(
+                    zip(_GEOJSON_PROPS, r),
+                    status="cracked" if r[10] else "unknown",
+                ),
+            }
+            for r in rows[i:i + _GEOJSON_FETCH_ROWS]
+            if r[11] is not None and r[12] is not None
+        ]
+        if not feats:
+            continue
+        chunk = orjson.dumps(feats)[1:-1]  # senza le [] esterne
+        yield chunk if first else b"," + chunk
+        first = False
+    yield b"]}"
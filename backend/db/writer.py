@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from concurrent.futures import Executor
+from typing import Optional
+
+from backend.db.queries import insert_network_record, insert_network_records
+
+log = logging.getLogger(__name__)
+
+# Massimo numero di righe per transazione e attesa massima per riempire un batch
+BATCH_MAX = 1000
+BATCH_WAIT_S = 0.05
+
+_queue: Optional[asyncio.Queue] = None
+_task: Optional[asyncio.Task] = None
+_executor: Optional[Executor] = None
+
+
+async def _flush(batch: list[tuple[dict, asyncio.Future]]) -> None:
+    rows = [row for row, _ in batch]
+    loop = asyncio.get_running_loop()
+    try:
+        ids = await loop.run_in_executor(_executor, insert_network_records, rows)
+    except Exception as e:
+        log.exception("writer: batch di %d righe fallito: %s", len(rows), e)
+        ids = [-1] * len(rows)
+    for (_, fut), new_id in zip(batch, ids):
+        if not fut.done():
+            fut.set_result(new_id)
+
+
+async def _drain(queue: asyncio.Queue) -> None:
+    loop = asyncio.get_running_loop()
+    stopping = False
+    while not stopping:
+        item = await queue.get()
+        if item is None:
+            break
+        batch = [item]
+        deadline = loop.time() + BATCH_WAIT_S
+        while len(batch) < BATCH_MAX:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if item is None:
+                stopping = True
+                break
+            batch.append(item)
+        await _flush(batch)
+
+
+def start_writer(executor: Optional[Executor] = None) -> None:
+    """
+    Avvia il task che raccoglie gli insert in batch (da chiamare allo startup).
+    I batch vengono scritti su executor (None = executor di default del loop).
+    """
+    global _queue, _task, _executor
+    if _task is not None:
+        return
+    _executor = executor
+    _queue = asyncio.Queue()
+    _task = asyncio.get_running_loop().create_task(_drain(_queue))
+
+
+async def stop_writer() -> None:
+    """Scrive quanto ancora in coda e ferma il task."""
+    global _queue, _task, _executor
+    if _task is None:
+        return
+    # _queue a None prima della sentinella: chi inserisce da qui in poi passa da
+    # to_thread invece di finire in coda dopo il None, dove nessuno lo leggerebbe
+    queue, _queue = _queue, None
+    queue.put_nowait(None)
+    await _task
+    _task = None
+    _executor = None
+
+
+async def insert_network_record_async(**row) -> int:
+    """Come insert_network_record, ma accodato al writer e scritto in batch."""
+    if _queue is None:
+        return await asyncio.to_thread(insert_network_record, **row)
+    fut = asyncio.get_running_loop().create_future()
+    await _queue.put((row, fut))
+    return await fut
@@ -1,22 +1,13 @@
 from __future__ import annotations
 from fastapi import APIRouter, Query
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
 from typing import Optional
 from backend.db.queries import select_networks_geojson
 
 router = APIRouter(prefix="/api/networks", tags=["networks"])
 
-class Feature(BaseModel):
-    type: str
-    geometry: dict
-    properties: dict
-
-class FeatureCollection(BaseModel):
-    type: str
-    features: list[Feature]
-
-@router.get("/geojson", response_model=FeatureCollection)
-async def networks_geojson(
+@router.get("/geojson")
+def networks_geojson(
     bbox: Optional[str] = Query(None, description="minLon,minLat,maxLon,maxLat"),
     cracked: Optional[bool] = Query(None),
     has_bssid: Optional[bool] = Query(None),
@@ -29,38 +20,31 @@ async def networks_geojson(
         if len(parts) == 4:
             bbox_t = (parts[0], parts[1], parts[2], parts[3])
 
-    fc = select_networks_geojson(
+    chunks = select_networks_geojson(
         bbox=bbox_t,
         cracked=cracked,
         has_bssid=has_bssid,
         q=q,
         limit=limit,
     )
-    for f in fc.get("features", []):
-        props = f.get("properties", {}) or {}
-        pwd = props.get("password")
-        status = "cracked" if pwd else "unknown"
-        props["status"] = status
-        f["properties"] = props
-
-    return fc
+    return StreamingResponse(chunks, media_type="application/geo+json")
 
 
 @router.get("/stats")
-async def stats():
+def stats():
     from backend.db.database import db_conn
-    sql = {
-        "total": "SELECT COUNT(*) FROM networks",
-        "with_coords": "SELECT COUNT(*) FROM networks WHERE lat IS NOT NULL AND lon IS NOT NULL",
-        "cracked": "SELECT COUNT(*) FROM networks WHERE password IS NOT NULL AND TRIM(password) != ''",
-        "uncracked": "SELECT COUNT(*) FROM networks WHERE password IS NULL OR TRIM(password) = ''",
-        "empty_bssid": "SELECT COUNT(*) FROM networks WHERE bssid IS NULL OR TRIM(bssid) = ''",
-    }
-    out = {}
+    # un solo passaggio sulla tabella per tutti i contatori
+    sql = """
+        SELECT
+            COUNT(*),
+            SUM(CASE WHEN lat IS NOT NULL AND lon IS NOT NULL THEN 1 ELSE 0 END),
+            SUM(CASE WHEN password IS NOT NULL AND TRIM(password) != '' THEN 1 ELSE 0 END),
+            SUM(CASE WHEN password IS NULL OR TRIM(password) = '' THEN 1 ELSE 0 END),
+            SUM(CASE WHEN bssid IS NULL OR TRIM(bssid) = '' THEN 1 ELSE 0 END)
+        FROM networks
+    """
     with db_conn() as conn:
-        cur = conn.cursor()
-        for k, q in sql.items():
-            cur.execute(q)
-            (cnt,) = cur.fetchone()
-            out[k] = cnt
-    return out
+        row = conn.execute(sql).fetchone()
+    keys = ("total", "with_coords", "cracked", "uncracked", "empty_bssid")
+    # SUM su tabella vuota restituisce NULL
+    return {k: v or 0 for k, v in zip(keys, row)}
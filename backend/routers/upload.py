@@ -1,30 +1,85 @@
 from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from starlette.datastructures import UploadFile as StarletteUploadFile
 from starlette.requests import Request
-import logging, re
+import asyncio, gzip, logging, os, shutil, zlib
 from pathlib import Path
+from typing import BinaryIO
 import aiofiles
 
 from backend.core.security import require_admin
-from backend.db.queries import insert_network_record
+from backend.db.writer import insert_network_record_async
 from backend.services.ingest import (
     safe_stem, parse_gps_json, build_capture_paths,
-    convert_pcap_to_hc22000_and_meta, lookup_vendor_from_csv
+    convert_pcap_to_hc22000_and_meta, lookup_vendor_from_csv, is_hex
 )
 
 router = APIRouter(prefix="/api", tags=["upload"])
 log = logging.getLogger(__name__)
 
-BSSID_RE = re.compile(r'^([0-9A-Fa-f]{2}[:\-]){5}[0-9A-Fa-f]{2}$')
+MAX_BATCH_PAIRS = 32
+GZIP_MAGIC = b"\x1f\x8b"  # nessun magic pcap/pcapng inizia così
+MAX_GUNZIP_BYTES = 64 * 1024 * 1024  # limite del pcap decompresso (contro le gzip bomb)
+_COPY_CHUNK = 4 * 1024 * 1024
+
 def norm_bssid(x: str | None) -> str | None:
+    """'aa-bb-...'/'aa:bb:...' -> 'AA:BB:CC:DD:EE:FF', None se non è un BSSID."""
     if not x: return None
     x = x.strip().upper().replace('-', ':')
-    return x if BSSID_RE.fullmatch(x) else None
+    if len(x) != 17 or x[2::3] != ":::::": return None
+    h = x.replace(':', '')
+    return x if len(h) == 12 and is_hex(h) else None
 
-@router.post("/upload", dependencies=[Depends(require_admin)])
-async def upload_pair(request: Request, pcap: UploadFile = File(...), gps: UploadFile = File(...)):
-    log.info("upload_pair: ct=%s ua=%s ip=%s", request.headers.get("content-type"),
-             request.headers.get("user-agent"), request.client.host if request.client else "?")
+def _save_upload(src: BinaryIO, dst: Path) -> None:
+    """
+    Copia su disco il file caricato. Se Starlette l'ha già spostato su un file
+    temporaneo usa sendfile (copia nel kernel), altrimenti copyfileobj.
+    Un pcap inviato compresso (gzip, magic 1f 8b) viene decompresso al volo,
+    fino a MAX_GUNZIP_BYTES: oltre, il file viene rimosso e si solleva ValueError.
+    """
+    src.seek(0)
+    magic = src.read(2)
+    src.seek(0)
+    if magic == GZIP_MAGIC:
+        try:
+            with gzip.GzipFile(fileobj=src, mode="rb") as gz, open(dst, "wb") as out:
+                written = 0
+                # un byte oltre il limite basta a riconoscere il file troppo grande
+                while chunk := gz.read(min(_COPY_CHUNK, MAX_GUNZIP_BYTES + 1 - written)):
+                    written += len(chunk)
+                    if written > MAX_GUNZIP_BYTES:
+                        raise ValueError(f"decompressed pcap larger than {MAX_GUNZIP_BYTES} bytes")
+                    out.write(chunk)
+        except (gzip.BadGzipFile, EOFError, zlib.error) as e:
+            dst.unlink(missing_ok=True)
+            raise ValueError(f"corrupt gzip pcap: {e}") from e
+        except ValueError:
+            dst.unlink(missing_ok=True)
+            raise
+        return
+    with open(dst, "wb") as out:
+        # SpooledTemporaryFile ancora in memoria: fileno() forzerebbe una scrittura su disco
+        if getattr(src, "_rolled", True) and hasattr(os, "sendfile"):
+            try:
+                in_fd = src.fileno()
+                size = os.fstat(in_fd).st_size
+                offset = 0
+                while offset < size:
+                    sent = os.sendfile(out.fileno(), in_fd, offset, size - offset)
+                    if sent == 0:
+                        break
+                    offset += sent
+                return
+            except OSError:
+                src.seek(0)
+                out.seek(0)
+                out.truncate()
+        shutil.copyfileobj(src, out, length=_COPY_CHUNK)
 
+async def _prepare_pair(pcap: UploadFile, gps: UploadFile) -> tuple[dict, bool]:
+    """
+    Salva una coppia pcap + gps ed estrae il 22000, senza inserire nulla.
+    Ritorna (riga per insert_network_record_async, hash estratto). HTTPException(400) se invalida.
+    """
     if not pcap.filename:
         log.warning("400: missing pcap filename")
         raise HTTPException(status_code=400, detail="pcap file missing filename")
@@ -41,17 +96,19 @@ async def upload_pair(request: Request, pcap: UploadFile = File(...), gps: Uploa
     paths = build_capture_paths(base_dir, gps_info["datetime"], ssid_from_name)
     paths["dir"].mkdir(parents=True, exist_ok=True)
 
-    async with aiofiles.open(paths["pcap_path"], "wb") as f:
-        while True:
-            chunk = await pcap.read(1024 * 1024)
-            if not chunk: break
-            await f.write(chunk)
+    try:
+        await asyncio.to_thread(_save_upload, pcap.file, paths["pcap_path"])
+    except ValueError as e:
+        log.warning("400: invalid pcap upload: %s", e)
+        raise HTTPException(status_code=400, detail=f"Invalid pcap: {e}")
     async with aiofiles.open(paths["gps_path"], "wb") as f:
         await f.write(gps_bytes)
 
     hc_meta = None
     try:
-        hc_meta = convert_pcap_to_hc22000_and_meta(paths["pcap_path"], paths["hc22000_path"])
+        hc_meta = await asyncio.to_thread(
+            convert_pcap_to_hc22000_and_meta, paths["pcap_path"], paths["hc22000_path"]
+        )
     except RuntimeError as e:
         log.warning("22000 conversion failed: %s", e)
 
@@ -68,7 +125,7 @@ async def upload_pair(request: Request, pcap: UploadFile = File(...), gps: Uploa
              gps_info["datetime"].strftime("%Y-%m-%d"),
              gps_info["datetime"].strftime("%H:%M:%S"))
 
-    record_id = insert_network_record(
+    row = dict(
         ssid=meta_ssid, hash_type=hash_type, hash_variant=hash_variant,
         bssid=bssid, vendor=vendor,
         date=gps_info["datetime"].strftime("%Y-%m-%d"),
@@ -77,8 +134,64 @@ async def upload_pair(request: Request, pcap: UploadFile = File(...), gps: Uploa
         alt=gps_info["altitude"], accuracy=gps_info["accuracy"],
         password=None,
     )
+    return row, hc_meta is not None
 
-    resp = {"ok": True, "ssid": meta_ssid, "record_id": record_id}
-    if hc_meta is None:
+def _pair_response(row: dict, hash_ok: bool, record_id: int) -> dict:
+    resp = {"ok": True, "ssid": row["ssid"], "record_id": record_id}
+    if not hash_ok:
         resp["hash_meta_error"] = "no_22000"
     return resp
+
+async def _ingest_pair(pcap: UploadFile, gps: UploadFile) -> dict:
+    """Salva una coppia pcap + gps, estrae il 22000 e inserisce il record. HTTPException(400) se invalida."""
+    row, hash_ok = await _prepare_pair(pcap, gps)
+    record_id = await insert_network_record_async(**row)
+    return _pair_response(row, hash_ok, record_id)
+
+@router.post("/upload", dependencies=[Depends(require_admin)])
+async def upload_pair(request: Request, pcap: UploadFile = File(...), gps: UploadFile = File(...)):
+    log.info("upload_pair: ct=%s ua=%s ip=%s", request.headers.get("content-type"),
+             request.headers.get("user-agent"), request.client.host if request.client else "?")
+    return await _ingest_pair(pcap, gps)
+
+@router.post("/upload/batch", dependencies=[Depends(require_admin)])
+async def upload_batch(request: Request):
+    """
+    Più coppie in un solo multipart: campi pcap_0/gps_0, pcap_1/gps_1, ...
+    Ritorna lo stato di ogni coppia: {"ok": True, "results": [{"index": i, "filename": ..., "ok": bool, ...}]}
+    """
+    log.info("upload_batch: ct=%s ua=%s ip=%s", request.headers.get("content-type"),
+             request.headers.get("user-agent"), request.client.host if request.client else "?")
+
+    form = await request.form(max_files=2 * MAX_BATCH_PAIRS)
+    try:
+        results = []
+        prepared = []  # (posizione in results, riga, hash estratto)
+        for i in range(MAX_BATCH_PAIRS + 1):
+            pcap, gps = form.get(f"pcap_{i}"), form.get(f"gps_{i}")
+            if pcap is None and gps is None:
+                break
+            if i == MAX_BATCH_PAIRS:
+                raise HTTPException(status_code=400, detail=f"Too many pairs (max {MAX_BATCH_PAIRS})")
+            filename = getattr(pcap, "filename", None)
+            if not isinstance(pcap, StarletteUploadFile) or not isinstance(gps, StarletteUploadFile):
+                results.append({"index": i, "filename": filename, "ok": False, "status": 400,
+                                "detail": f"pcap_{i} and gps_{i} must both be files"})
+                continue
+            try:
+                row, hash_ok = await _prepare_pair(pcap, gps)
+            except HTTPException as e:
+                results.append({"index": i, "filename": filename, "ok": False,
+                                "status": e.status_code, "detail": e.detail})
+                continue
+            prepared.append((len(results), row, hash_ok))
+            results.append({"index": i, "filename": filename})
+        if not results:
+            raise HTTPException(status_code=400, detail="No pcap_0/gps_0 pair in batch")
+        # insert accodati insieme: il writer li scrive in un'unica transazione
+        ids = await asyncio.gather(*(insert_network_record_async(**row) for _, row, _ in prepared))
+        for (pos, row, hash_ok), record_id in zip(prepared, ids):
+            results[pos].update(_pair_response(row, hash_ok, record_id))
+    finally:
+        await form.close()
+    return {"ok": True, "results": results}
@@ -5,5 +5,5 @@ from backend.services.wpasec_sync import sync_now
 router = APIRouter(prefix="/api/wpasec", tags=["wpasec"])
 
 @router.post("/sync")
-async def wpasec_sync():
-    return sync_now()
\ No newline at end of file
+def wpasec_sync(include_pairs: bool = False):
+    return sync_now(include_pairs=include_pairs)
\ No newline at end of file
@@ -1,14 +1,20 @@
 from __future__ import annotations
 from pathlib import Path
 from datetime import datetime
-import json
 import logging
-import subprocess
 import csv
-from typing import Optional, Dict
+from array import array
+from bisect import bisect_left
+from typing import Optional, Dict, List
+
+import orjson
+
+from backend.services.pcap_parse import extract_hashes
 
 log = logging.getLogger(__name__)
 
+_HEX = frozenset(b"0123456789abcdefABCDEF")
+
 # ---------- Filename helper ----------
 
 def safe_stem(name: str) -> str:
@@ -24,6 +30,18 @@ def _parse_updated_datetime(updated: str) -> datetime:
     Expected example: "2025-08-29 21:05:52"
     """
     s = updated.strip()
+    # Fast path: formato fisso "YYYY-MM-DD HH:MM:SS"
+    if (
+        len(s) == 19
+        and s[4] == "-" and s[7] == "-" and s[10] in " T" and s[13] == ":" and s[16] == ":"
+    ):
+        try:
+            return datetime(
+                int(s[0:4]), int(s[5:7]), int(s[8:10]),
+                int(s[11:13]), int(s[14:16]), int(s[17:19]),
+            )
+        except ValueError:
+            pass
     # ISO tolerant
     try:
         return datetime.fromisoformat(s.replace("Z", "+00:00")).replace(tzinfo=None)
@@ -48,7 +66,7 @@ def parse_gps_json(raw: bytes) -> dict:
       }
     """
     try:
-        data = json.loads(raw.decode("utf-8"))
+        data = orjson.loads(raw)
     except Exception as e:
         raise ValueError(f"Invalid JSON: {e}")
 
@@ -95,105 +113,47 @@ def build_capture_paths(base_dir: Path, dt: datetime, ssid: str) -> dict:
 
 # ---------- 22000 conversion & parsing ----------
 
-def _run(cmd: list[str]) -> subprocess.CompletedProcess:
-    return subprocess.run(
-        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=False
-    )
-
-def _is_hex(s: str) -> bool:
-    return len(s) % 2 == 0 and all(c in "0123456789abcdefABCDEF" for c in s)
+def is_hex(s: str) -> bool:
+    """True se s è una stringa hex ASCII di lunghezza pari (vuota compresa)."""
+    return len(s) % 2 == 0 and _HEX.issuperset(s.encode())
 
 def _decode_essid(essid_field: str) -> str:
-    if _is_hex(essid_field):
+    if is_hex(essid_field):
         try:
             return bytes.fromhex(essid_field).decode("utf-8", errors="ignore")
         except Exception:
             return essid_field
     return essid_field
 
-def _parse_22000_line(line: str) -> dict:
-    s = line.strip()
-    if not s.startswith("WPA*"):
-        raise ValueError("Not a 22000 WPA hashline")
-
-    parts = s.split("*")
-    if len(parts) < 3:
-        raise ValueError("Truncated 22000 line")
-
-    kind_code = parts[1]
-
-    if kind_code == "01":  # PMKID
-        if len(parts) < 6:
-            raise ValueError("Invalid PMKID 22000 line")
-        return {
-            "kind": "PMKID",
-            "bssid": parts[3],
-            "station": parts[4],
-            "ssid": _decode_essid(parts[5]),
-            "hash_type": "WPA",
-            "variant": "PMKID",
-        }
-
-    if kind_code == "02":  # EAPOL
-        if len(parts) < 6:
-            raise ValueError("Invalid EAPOL 22000 line")
-        return {
-            "kind": "EAPOL",
-            "bssid": parts[3],
-            "station": parts[4],
-            "ssid": _decode_essid(parts[5]),
-            "hash_type": "WPA",
-            "variant": "EAPOL",
-        }
-
-    raise ValueError(f"Unknown 22000 kind code: {kind_code}")
-
 def _fmt_mac_colon(hex12: str) -> str:
     """'aabbccddeeff' -> 'AA:BB:CC:DD:EE:FF'"""
-    h = "".join(c for c in hex12 if c in "0123456789abcdefABCDEF")
-    if len(h) != 12:
+    h = hex12.replace(":", "").replace("-", "")
+    if len(h) != 12 or not is_hex(h):
         return ""
-    return ":".join(h[i:i+2] for i in range(0, 12, 2)).upper()
+    return bytes.fromhex(h).hex(":").upper()
 
 def convert_pcap_to_hc22000_and_meta(pcap_path: Path, out_22000: Path) -> dict | None:
     if not pcap_path.exists():
         raise RuntimeError(f"pcap not found: {pcap_path}")
 
-    cmd = ["hcxpcapngtool", "-o", str(out_22000), str(pcap_path)]
-    proc = _run(cmd)
-
-    if proc.returncode != 0:
-        raise RuntimeError(
-            f"hcxpcapngtool failed: {proc.stderr.strip() or proc.stdout.strip() or 'unknown error'}"
-        )
-
-    if not out_22000.exists():
-        raise RuntimeError("Conversion produced no .22000 file")
-
-    text = out_22000.read_text(encoding="utf-8", errors="ignore").strip()
-    if not text:
-        raise RuntimeError("No valid WPA* lines in .22000")
-
-    first_line = next((ln for ln in text.splitlines() if ln.startswith("WPA*")), None)
-    if not first_line:
-        raise RuntimeError("No WPA* lines found in .22000")
+    try:
+        records = extract_hashes(pcap_path)
+    except (OSError, ValueError) as e:
+        raise RuntimeError(f"pcap parsing failed: {e}") from e
 
-    meta = _parse_22000_line(first_line)
+    if not records:
+        raise RuntimeError("No WPA* hashes found in pcap")
 
-    # Normalizza BSSID
-    bssid_raw = (meta.get("bssid") or "").replace(":", "").replace("-", "")
-    bssid_hex12 = bssid_raw.lower()
-    if not (len(bssid_hex12) == 12 and all(c in "0123456789abcdef" for c in bssid_hex12)):
-        bssid_hex12 = ""
+    out_22000.write_text("".join(r["line"] + "\n" for r in records), encoding="utf-8")
 
-    ssid = meta.get("ssid") or ""
-    variant = meta.get("variant") or ("PMKID" if meta.get("kind") == "PMKID" else "EAPOL")
+    meta = records[0]
+    ssid = _decode_essid(meta["essid"])
 
     return {
         "ssid": ssid or None,
-        "bssid": (_fmt_mac_colon(bssid_hex12) if bssid_hex12 else None),
+        "bssid": _fmt_mac_colon(meta["bssid"]) or None,
         "type": "WPA",
-        "variant": variant,
+        "variant": meta["variant"],
     }
 
 
@@ -201,7 +161,9 @@ def convert_pcap_to_hc22000_and_meta(pcap_path: Path, out_22000: Path) -> dict |
 
 class OUILookup:
     _loaded: bool = False
-    _map_by_len: Dict[int, Dict[str, str]] = {6: {}, 7: {}, 9: {}}
+    # per lunghezza del prefisso (hex): chiavi intere ordinate + vendor paralleli
+    _keys_by_len: Dict[int, array] = {6: array("Q"), 7: array("Q"), 9: array("Q")}
+    _vendors_by_len: Dict[int, List[str]] = {6: [], 7: [], 9: []}
     _csv_path: Path = Path("data/meta/vendor_oui.csv")
 
     @classmethod
@@ -213,6 +175,7 @@ class OUILookup:
             log.warning("OUI CSV not found at %s", p)
             cls._loaded = True
             return
+        map_by_len: Dict[int, Dict[int, str]] = {6: {}, 7: {}, 9: {}}
         with p.open("r", encoding="utf-8", newline="") as f:
             reader = csv.reader(f)
             for row in reader:
@@ -223,36 +186,52 @@ class OUILookup:
                 prefix = row[0].strip().upper()
                 vendor = row[1].strip()
                 L = len(prefix)
-                if L in (6, 7, 9) and all(c in "0123456789ABCDEF" for c in prefix):
-                    cls._map_by_len[L][prefix] = vendor
+                if L in (6, 7, 9) and vendor and _HEX.issuperset(prefix.encode()):
+                    map_by_len[L][int(prefix, 16)] = vendor
+        for L, m in map_by_len.items():
+            keys = sorted(m)
+            cls._keys_by_len[L] = array("Q", keys)
+            cls._vendors_by_len[L] = [m[k] for k in keys]
         cls._loaded = True
         log.info(
             "OUI loaded: %d (24b), %d (28b), %d (36b)",
-            len(cls._map_by_len[6]),
-            len(cls._map_by_len[7]),
-            len(cls._map_by_len[9]),
+            len(cls._keys_by_len[6]),
+            len(cls._keys_by_len[7]),
+            len(cls._keys_by_len[9]),
         )
 
+    @classmethod
+    def preload(cls) -> None:
+        """Carica subito la tabella OUI (allo startup) invece che al primo lookup."""
+        cls._load()
+
+    @classmethod
+    def _find(cls, L: int, key: int) -> Optional[str]:
+        keys = cls._keys_by_len[L]
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            return cls._vendors_by_len[L][i]
+        return None
+
     @classmethod
     def vendor_for_bssid(cls, bssid_hex12: str) -> Optional[str]:
         cls._load()
         if not bssid_hex12:
             return None
-        mac = "".join(c for c in bssid_hex12.upper() if c in "0123456789ABCDEF")
+        mac = bssid_hex12.replace(":", "").replace("-", "")
         if len(mac) < 9:
             return None
-        for L in (9, 7, 6):
-            pref = mac[:L]
-            vendor = cls._map_by_len[L].get(pref)
-            if vendor:
-                return vendor
-        return None
+        try:
+            p36 = int(mac[:9], 16)
+        except ValueError:
+            return None
+        return cls._find(9, p36) or cls._find(7, p36 >> 8) or cls._find(6, p36 >> 12)
 
 
 def lookup_vendor_from_csv(bssid: Optional[str]) -> Optional[str]:
     if not bssid:
         return None
-    cleaned = bssid.replace(":", "").replace("-", "").strip().upper()
-    if len(cleaned) != 12 or not all(c in "0123456789ABCDEF" for c in cleaned):
+    cleaned = bssid.replace(":", "").replace("-", "").strip()
+    if len(cleaned) != 12 or not is_hex(cleaned):
         return None
     return OUILookup.vendor_for_bssid(cleaned)
@@ -0,0 +1,256 @@
+from __future__ import annotations
+from pathlib import Path
+import struct
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+# ---------- Capture readers (pcap / pcapng) ----------
+
+LINKTYPE_IEEE802_11 = 105
+LINKTYPE_IEEE802_11_RADIOTAP = 127
+
+_PCAP_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": "<",  # microseconds
+    b"\xa1\xb2\xc3\xd4": ">",
+    b"\x4d\x3c\xb2\xa1": "<",  # nanoseconds
+    b"\xa1\xb2\x3c\x4d": ">",
+}
+_PCAPNG_SHB = b"\x0a\x0d\x0d\x0a"
+
+
+def _iter_pcap(f: BinaryIO, endian: str) -> Iterator[Tuple[int, bytes]]:
+    hdr = f.read(20)  # resto dell'header globale dopo il magic
+    if len(hdr) < 20:
+        return
+    linktype = struct.unpack(endian + "HHiIII", hdr)[5] & 0xFFFF
+    rec = struct.Struct(endian + "IIII")
+    while True:
+        h = f.read(16)
+        if len(h) < 16:
+            return
+        _, _, incl_len, _ = rec.unpack(h)
+        data = f.read(incl_len)
+        if len(data) < incl_len:
+            return
+        yield linktype, data
+
+
+def _iter_pcapng(f: BinaryIO) -> Iterator[Tuple[int, bytes]]:
+    endian = "<"
+    linktypes: List[int] = []
+    while True:
+        head = f.read(8)
+        if len(head) < 8:
+            return
+        if head[:4] == _PCAPNG_SHB:
+            bom = f.read(4)
+            if len(bom) < 4:
+                return
+            endian = "<" if bom == b"\x4d\x3c\x2b\x1a" else ">"
+            linktypes = []
+            total_len = struct.unpack(endian + "I", head[4:])[0]
+            if total_len < 12:
+                return
+            body = f.read(total_len - 12)
+            if len(body) < total_len - 12:
+                return
+            continue
+
+        btype, total_len = struct.unpack(endian + "II", head)
+        if total_len < 12:
+            return
+        body = f.read(total_len - 8)
+        if len(body) < total_len - 8:
+            return
+
+        if btype == 1:  # Interface Description Block
+            if len(body) < 2:
+                return
+            linktypes.append(struct.unpack_from(endian + "H", body, 0)[0])
+        elif btype == 6:  # Enhanced Packet Block
+            if len(body) < 20:
+                return
+            if_id, _, _, cap_len, _ = struct.unpack_from(endian + "IIIII", body, 0)
+            if if_id < len(linktypes):
+                yield linktypes[if_id], body[20:20 + cap_len]
+        elif btype == 3 and linktypes:  # Simple Packet Block
+            yield linktypes[0], body[4:total_len - 12]
+
+
+def iter_frames(pcap_path: Path) -> Iterator[Tuple[int, bytes]]:
+    """Yields (linktype, raw_frame) for every packet in a pcap or pcapng file."""
+    with pcap_path.open("rb") as f:
+        magic = f.read(4)
+        if magic in _PCAP_MAGIC:
+            yield from _iter_pcap(f, _PCAP_MAGIC[magic])
+        elif magic == _PCAPNG_SHB:
+            f.seek(0)
+            yield from _iter_pcapng(f)
+        else:
+            raise ValueError("Not a pcap/pcapng file")
+
+
+def _dot11_frame(linktype: int, data: bytes) -> Optional[bytes]:
+    if linktype == LINKTYPE_IEEE802_11:
+        return data
+    if linktype == LINKTYPE_IEEE802_11_RADIOTAP and len(data) >= 4:
+        rt_len = struct.unpack_from("<H", data, 2)[0]
+        return data[rt_len:]
+    return None
+
+
+# ---------- 802.11 / EAPOL parsing ----------
+
+_LLC_SNAP_EAPOL = b"\xaa\xaa\x03\x00\x00\x00\x88\x8e"
+_PMKID_KDE = b"\x00\x0f\xac\x04"
+
+_KI_PAIRWISE = 0x0008
+_KI_INSTALL = 0x0040
+_KI_ACK = 0x0080
+_KI_MIC = 0x0100
+_KI_SECURE = 0x0200
+
+# offset dentro il frame EAPOL (header 802.1X incluso)
+_EAPOL_REPLAY = slice(9, 17)
+_EAPOL_NONCE = slice(17, 49)
+_EAPOL_MIC = slice(81, 97)
+_EAPOL_MIN_LEN = 99
+
+
+def _ssid_from_ies(ies: bytes) -> Optional[bytes]:
+    i = 0
+    while i + 2 <= len(ies):
+        eid, elen = ies[i], ies[i + 1]
+        if eid == 0:
+            ssid = ies[i + 2:i + 2 + elen]
+            # SSID nascosto: vuoto o tutto a zero
+            return ssid if ssid.strip(b"\x00") else None
+        i += 2 + elen
+    return None
+
+
+def _pmkid_from_key_data(key_data: bytes) -> Optional[bytes]:
+    i = 0
+    while i + 2 <= len(key_data):
+        kid, klen = key_data[i], key_data[i + 1]
+        if kid == 0xDD and klen >= 20 and key_data[i + 2:i + 6] == _PMKID_KDE:
+            pmkid = key_data[i + 6:i + 22]
+            return pmkid if pmkid.strip(b"\x00") else None
+        i += 2 + klen
+    return None
+
+
+class _Collector:
+    def __init__(self) -> None:
+        self.essids: Dict[bytes, bytes] = {}
+        self.m1: Dict[Tuple[bytes, bytes], Tuple[bytes, bytes]] = {}  # (ap, sta) -> (replay, anonce)
+        self.pmkids: Dict[Tuple[bytes, bytes], bytes] = {}
+        self.eapols: Dict[Tuple[bytes, bytes], Tuple[bytes, bytes, bytes]] = {}  # -> (mic, anonce, eapol)
+
+    def feed(self, frame: bytes) -> None:
+        if len(frame) < 24:
+            return
+        fc, flags = frame[0], frame[1]
+        ftype = (fc >> 2) & 0x3
+        subtype = (fc >> 4) & 0xF
+
+        if ftype == 0:
+            self._management(frame, flags, subtype)
+        elif ftype == 2 and not flags & 0x40:  # dati non cifrati
+            self._data(frame, flags, subtype)
+
+    def _management(self, frame: bytes, flags: int, subtype: int) -> None:
+        fixed = {8: 12, 5: 12, 0: 4, 2: 10}.get(subtype)  # beacon, probe resp, (re)assoc req
+        if fixed is None:
+            return
+        body = 24 + (4 if flags & 0x80 else 0)
+        ssid = _ssid_from_ies(frame[body + fixed:])
+        if ssid:
+            self.essids.setdefault(frame[16:22], ssid)
+
+    def _data(self, frame: bytes, flags: int, subtype: int) -> None:
+        to_ds, from_ds = flags & 0x01, flags & 0x02
+        if from_ds and not to_ds:
+            ap, sta = frame[10:16], frame[4:10]
+        elif to_ds and not from_ds:
+            ap, sta = frame[4:10], frame[10:16]
+        else:
+            return
+
+        hdr = 24
+        if subtype & 0x8:  # QoS
+            hdr += 2 + (4 if flags & 0x80 else 0)
+        if frame[hdr:hdr + 8] != _LLC_SNAP_EAPOL:
+            return
+        eapol = frame[hdr + 8:]
+        if len(eapol) < _EAPOL_MIN_LEN or eapol[1] != 3 or eapol[4] not in (2, 254):
+            return
+        eapol = eapol[:4 + struct.unpack_from(">H", eapol, 2)[0]]
+        if len(eapol) < _EAPOL_MIN_LEN:
+            return
+
+        key_info = struct.unpack_from(">H", eapol, 5)[0]
+        if not key_info & _KI_PAIRWISE:
+            return
+        key_data_len = struct.unpack_from(">H", eapol, 97)[0]
+        key_data = eapol[_EAPOL_MIN_LEN:_EAPOL_MIN_LEN + key_data_len]
+        pair = (ap, sta)
+
+        if key_info & _KI_ACK and not key_info & _KI_MIC:  # M1
+            self.m1[pair] = (eapol[_EAPOL_REPLAY], eapol[_EAPOL_NONCE])
+            pmkid = _pmkid_from_key_data(key_data)
+            if pmkid:
+                self.pmkids.setdefault(pair, pmkid)
+        elif key_info & _KI_MIC and not key_info & (_KI_ACK | _KI_INSTALL | _KI_SECURE):  # M2
+            m1 = self.m1.get(pair)
+            if m1 is None or m1[0] != eapol[_EAPOL_REPLAY] or pair in self.eapols:
+                return
+            zeroed = eapol[:_EAPOL_MIC.start] + bytes(16) + eapol[_EAPOL_MIC.stop:]
+            self.eapols[pair] = (eapol[_EAPOL_MIC], m1[1], zeroed)
+
+    def records(self) -> List[dict]:
+        out: List[dict] = []
+        for (ap, sta), pmkid in self.pmkids.items():
+            essid = self.essids.get(ap)
+            if essid:
+                out.append({
+                    "line": f"WPA*01*{pmkid.hex()}*{ap.hex()}*{sta.hex()}*{essid.hex()}***",
+                    "variant": "PMKID",
+                    "bssid": ap.hex(),
+                    "essid": essid.hex(),
+                })
+        for (ap, sta), (mic, anonce, eapol) in self.eapols.items():
+            essid = self.essids.get(ap)
+            if essid:
+                out.append({
+                    "line": (
+                        f"WPA*02*{mic.hex()}*{ap.hex()}*{sta.hex()}*{essid.hex()}"
+                        f"*{anonce.hex()}*{eapol.hex()}*00"
+                    ),
+                    "variant": "EAPOL",
+                    "bssid": ap.hex(),
+                    "essid": essid.hex(),
+                })
+        return out
+
+
+def extract_hashes(pcap_path: Path) -> List[dict]:
+    """
+    Parses a capture in-process and returns the hashcat 22000 records found:
+      [{'line': 'WPA*01*...', 'variant': 'PMKID'|'EAPOL', 'bssid': hex12, 'essid': hex}, ...]
+    PMKID records come first. Networks without a known ESSID are skipped,
+    as hcxpcapngtool does. A truncated file yields what was read before the cut.
+    Raises ValueError if the file is not a capture or is malformed.
+    """
+    col = _Collector()
+    try:
+        for linktype, data in iter_frames(pcap_path):
+            frame = _dot11_frame(linktype, data)
+            if frame is None:
+                continue
+            try:
+                col.feed(frame)
+            except (IndexError, struct.error):
+                continue  # frame troncato
+    except struct.error as e:
+        raise ValueError(f"Malformed capture: {e}") from e
+    return col.records()
@@ -1,19 +1,54 @@
 from __future__ import annotations
+import hashlib
+import http.cookiejar
 import json
+import logging
+import queue
+import random
 import re
+import threading
 import time
-from typing import Iterable, Tuple, List, Dict, Optional
+from itertools import takewhile
+from typing import Callable, Dict, ItemsView, Iterable, Iterator, List, Optional, Tuple
 
 import requests
 from requests import Response
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from backend.core.settings import settings
-from backend.db.queries import bulk_update_passwords
+from backend.db.queries import bulk_update_passwords, max_network_id
+
+log = logging.getLogger(__name__)
 
 USER_AGENT = "PwnmapSync/1.0"
+UPDATE_CHUNK_ROWS = 10_000
+# download ripetuti se la connessione cade durante la lettura del body
+STREAM_RETRIES = 3
 
 # Regex utili
-_MAC_RE = re.compile(r"(?i)\b([0-9a-f]{2}(?::[0-9a-f]{2}){5})\b")
+_KV_RE = re.compile(r"(?:AP|APMAC|BSSID|AP_MAC|BSSID_MAC)=([0-9a-f]{12})", re.I)
+
+# Tutte le forme del potfile con un solo match per riga. Lo stesso pattern
+# serve sia il download (bytes) sia parse_pot_line (str), così le due strade
+# leggono le righe allo stesso modo:
+#   1) [HASH:]APMAC:STAMAC:SSID:PASS               -> gruppi 1, 2
+#   2) WPA*01|02*[PMKID*|HASH*]AP*STA[*...]:PASS   -> gruppi 3, 4
+#   3) riga con AP=... / BSSID=... (rara)          -> gruppo 5, passa da _pot_kv
+# Regola dei ':' : HASH (se c'è) sono 32 cifre hex, AP e STA 12 cifre hex,
+# l'SSID non contiene ':' e la password è tutto il resto della riga (può
+# contenere ':' e '*'). Nelle righe WPA* la password segue il primo ':'.
+_POT_PATTERN = (
+    r"(?:"
+    r"(?:[0-9a-f]{32}:)?([0-9a-f]{12}):[0-9a-f]{12}:[^:\r\n]*:([^\r\n]+)"
+    r"|WPA\*0[12]\*(?:PMKID\*|[0-9a-f]{32}\*)?([0-9a-f]{12})\*[0-9a-f]{12}(?:\*[^:\r\n]*)?:([^\r\n]+)"
+    r"|([^\r\n]*(?:AP|APMAC|BSSID|AP_MAC|BSSID_MAC)=[0-9a-f]{12}[^\r\n]*)"
+    r")"
+)
+_POT_LINE_RE = re.compile(_POT_PATTERN.encode("ascii"), re.I)
+_POT_LINE_STR_RE = re.compile(_POT_PATTERN, re.I | re.A)
+# Pagina HTML (login/errore) al posto del potfile: <html ...> o </html>
+_HTML_SNIFF = re.compile(rb"<\s*/?\s*html", re.I)
 
 class WpaSecSyncError(RuntimeError):
     pass
@@ -22,10 +57,27 @@ class WpaSecSyncError(RuntimeError):
 # Parsing potfile
 # -----------------------------
 def _hex_to_mac(s: str) -> str:
-    s = s.strip().upper()
-    if len(s) == 12 and all(c in "0123456789ABCDEF" for c in s):
-        return ":".join(s[i:i+2] for i in range(0, 12, 2))
-    return ""
+    s = s.strip()
+    if len(s) != 12:
+        return ""
+    try:
+        b = bytes.fromhex(s)
+    except ValueError:
+        return ""
+    # fromhex salta gli spazi: "AA BB CCDDEE" darebbe 5 byte
+    if len(b) != 6:
+        return ""
+    return b.hex(":").upper()
+
+
+def _pot_kv(s: str) -> Optional[Tuple[str, str]]:
+    # ... AP=001122AABBCC ... :PASS
+    m = _KV_RE.search(s)
+    if m is None:
+        return None
+    bssid = _hex_to_mac(m.group(1))
+    pwd = s.partition(":")[2]
+    return (bssid, pwd) if bssid and pwd else None
 
 
 def parse_pot_line(line: str) -> Optional[Tuple[str, str]]:
@@ -33,161 +85,358 @@ def parse_pot_line(line: str) -> Optional[Tuple[str, str]]:
 
     Accetta:
       - APMAC:STAMAC:SSID:PASS
-      - MIC/PMKID:APMAC:STAMAC:SSID:PASS   (short form)
-      - WPA*01*PMKID*AP*STA*...:PASS
-      - WPA*02*AP*STA*...:PASS
-      - ... AP=001122AABBCC ... :PASS   (fallback key=value)
+      - HASH:APMAC:STAMAC:SSID:PASS        (MIC/PMKID di 32 cifre hex)
+      - WPA*01|02*[PMKID*|HASH*]AP*STA[*...]:PASS
+      - ... AP=001122AABBCC ... :PASS     (fallback key=value)
+
+    Stessa regola di parse_pot_lines (vedi _POT_PATTERN): nelle righe a ':'
+    l'SSID non contiene ':' e la password è tutto il resto della riga.
     """
-    try:
-        s = line.rstrip("\r\n")
-        if not s or s.startswith("#"):
-            return None
-
-        parts_colon = s.split(":")
-        n = len(parts_colon)
-
-        # 1) Short form: MIC/PMKID:APMAC:STAMAC:SSID:PASS
-        if n >= 5:
-            ap_hex = parts_colon[1]
-            pwd = parts_colon[-1]
-            bssid = _hex_to_mac(ap_hex)
-            if bssid and pwd:
-                return (bssid, pwd)
-
-        # 2) Formato semplice: APMAC:STAMAC:SSID:PASS
-        if n >= 4:
-            ap_hex = parts_colon[0]
-            pwd = parts_colon[-1]
-            bssid = _hex_to_mac(ap_hex)
-            if bssid and pwd:
-                return (bssid, pwd)
-
-        # 3) WPA*01/02*...:PASS
-        if ":" in s:
-            hashpart, pwd = s.split(":", 1)
-            if pwd and hashpart.startswith("WPA*"):
-                seg = hashpart.split("*")
-                if len(seg) >= 3:
-                    if seg[1] in {"01", "02"}:
-                        # PMKID: WPA*01*PMKID*AP*STA*...
-                        if len(seg) >= 5 and seg[2].upper() == "PMKID":
-                            ap_hex = seg[3]
-                            bssid = _hex_to_mac(ap_hex)
-                            if bssid:
-                                return (bssid, pwd)
-                        # EAPOL: WPA*02*AP*STA*...
-                        ap_hex = seg[2]
-                        bssid = _hex_to_mac(ap_hex)
-                        if bssid:
-                            return (bssid, pwd)
-
-        # 4) Fallback: AP=XXXXXXXXXXXX / BSSID=XXXXXXXXXXXX
-        for key in ("AP=", "APMAC=", "BSSID=", "AP_MAC=", "BSSID_MAC="):
-            m = re.search(rf"{re.escape(key)}([0-9A-Fa-f]{{12}})", s)
-            if m:
-                bssid = _hex_to_mac(m.group(1))
-                if bssid:
-                    pwd = s.split(":", 1)[1] if ":" in s else ""
-                    if pwd:
-                        return (bssid, pwd)
-    except Exception:
+    s = line.rstrip("\r\n")
+    if not s or s[0] == "#":
         return None
-    return None
-
+    m = _POT_LINE_STR_RE.match(s)
+    if m is None:
+        return None
+    last = m.lastindex
+    if last == 5:
+        return _pot_kv(s)
+    ap, pwd = m.group(last - 1, last)
+    return (_hex_to_mac(ap), pwd)
 
-def _is_valid_bssid(s: str) -> bool:
-    return bool(_MAC_RE.fullmatch(s))
 
+def parse_pot_lines(
+    lines: Iterable[bytes],
+    best: Dict[str, str],
+    sink: Optional[Callable[[str, str], None]] = None,
+) -> Dict[str, str]:
+    """Aggiunge a best le coppie bssid -> password delle righe (bytes) di un potfile.
 
-def _dedup_cracked(pairs: Iterable[Tuple[str, str]]) -> List[Tuple[str, str]]:
-    """Deduplica per BSSID, preferendo password non vuote (mantiene la prima non vuota)."""
-    best: Dict[str, str] = {}
-    for bssid, pwd in pairs:
-        if not _is_valid_bssid(bssid):
+    Dedup nello stesso passaggio: per ogni BSSID resta la prima password trovata.
+    Se c'è, sink riceve ogni coppia nuova appena trovata (già definitiva).
+    """
+    match = _POT_LINE_RE.match
+    for line in lines:
+        m = match(line)
+        if m is None:
             continue
-        bssid_u = bssid.upper()
-        cur = best.get(bssid_u)
-        if cur is None or (not cur and pwd):
-            best[bssid_u] = pwd
-    return [(b, p) for b, p in best.items()]
+        last = m.lastindex
+        if last == 5:
+            parsed = parse_pot_line(m.group(5).decode("utf-8", errors="replace"))
+            if parsed is None or parsed[0] in best:
+                continue
+            bssid, pwd = parsed
+        else:
+            # il regex garantisce 12 cifre hex e password non vuota
+            ap, raw_pwd = m.group(last - 1, last)
+            bssid = bytes.fromhex(ap.decode("ascii")).hex(":").upper()
+            if bssid in best:
+                continue
+            pwd = raw_pwd.decode("utf-8", errors="replace")
+        best[bssid] = pwd
+        if sink is not None:
+            sink(bssid, pwd)
+    return best
+
+
+class _UpdatePipeline:
+    """
+    Aggiorna il DB in un thread a parte mentre il download/parsing continua:
+    le coppie arrivano con add(), blocchi di chunk_rows passano al thread via
+    una coda limitata (depth blocchi in attesa al massimo).
+    """
+
+    def __init__(self, chunk_rows: int = UPDATE_CHUNK_ROWS, depth: int = 4):
+        self._chunk_rows = chunk_rows
+        self._pending: List[Tuple[str, str]] = []
+        self._queue: "queue.Queue[Optional[List[Tuple[str, str]]]]" = queue.Queue(maxsize=depth)
+        self._error: Optional[BaseException] = None
+        self.rows_updated = 0
+        self._thread = threading.Thread(target=self._run, name="wpasec-db-update", daemon=True)
+        self._thread.start()
+
+    def add(self, bssid: str, pwd: str) -> None:
+        self._pending.append((bssid, pwd))
+        if len(self._pending) >= self._chunk_rows:
+            self._queue.put(self._pending)
+            self._pending = []
+
+    def _run(self) -> None:
+        while (chunk := self._queue.get()) is not None:
+            if self._error is not None:
+                continue  # dopo un errore si svuota solo la coda
+            try:
+                self.rows_updated += bulk_update_passwords(chunk)
+            except BaseException as e:
+                self._error = e
+
+    def close(self, raise_error: bool = True) -> int:
+        """
+        Scrive l'ultimo blocco, attende il thread e ritorna le righe aggiornate.
+        Un errore del DB viene rilanciato, oppure solo loggato con raise_error=False
+        (quando c'è già un'altra eccezione da propagare).
+        """
+        if self._pending:
+            self._queue.put(self._pending)
+            self._pending = []
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            if raise_error:
+                raise self._error
+            log.warning("Aggiornamento password nel DB fallito: %s", self._error)
+        return self.rows_updated
 
 
 # -----------------------------
 # Download potfile (con fallback cookie)
 # -----------------------------
-def _http_get_with_retry(url: str, *, timeout: int = 60, retries: int = 3, backoff: float = 1.5) -> Response:
-    headers = {"User-Agent": USER_AGENT}
-    last_exc: Exception | None = None
-    for attempt in range(1, retries + 1):
-        try:
-            r = requests.get(url, headers=headers, timeout=timeout)
-            r.raise_for_status()
-            return r
-        except Exception as e:
-            last_exc = e
-            if attempt == retries:
-                break
-            time.sleep(backoff ** attempt)
-    raise WpaSecSyncError(f"HTTP GET failed for {url}: {last_exc}")
-
-
-def download_cracked_potfile() -> List[Tuple[str, str]]:
+class _JitterRetry(Retry):
+    """
+    Backoff esponenziale con jitter moltiplicativo: base * 2**n * (1 ± jitter),
+    al massimo backoff_max, con n = 0 già al primo retry (urllib3 non attende).
+    """
+
+    def get_backoff_time(self) -> float:
+        errors = len(list(takewhile(lambda x: x.redirect_location is None, reversed(self.history))))
+        if errors == 0:
+            return 0
+        return _jittered_backoff(errors - 1, self.backoff_factor, self.backoff_max, self.backoff_jitter)
+
+
+def _jittered_backoff(n: int, base: float, cap: float, jitter: float) -> float:
+    delay = base * (2 ** n) * (1 + random.uniform(-jitter, jitter))
+    return max(0.0, min(cap, delay))
+
+
+def _make_session(retries: int = 3) -> requests.Session:
+    """Sessione keep-alive riusata da tutte le richieste verso wpa-sec (retry gestiti da urllib3)."""
+    retry = _JitterRetry(
+        total=retries,
+        backoff_factor=settings.wpasec_backoff_base,
+        backoff_max=settings.wpasec_backoff_max,
+        backoff_jitter=settings.wpasec_backoff_jitter,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=retry)
+    s = requests.Session()
+    s.headers["User-Agent"] = USER_AGENT
+    # nessun cookie tra una sync e l'altra: la chiave del fallback va solo per richiesta
+    s.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+
+_SESSION = _make_session()
+
+
+def _http_get_with_retry(url: str, *, timeout: int = 60, stream: bool = False, **kwargs) -> Response:
+    try:
+        r = _SESSION.get(url, timeout=timeout, stream=stream, **kwargs)
+    except requests.RequestException as e:
+        raise WpaSecSyncError(f"HTTP GET failed for {url}: {e}") from e
+    if not r.ok:
+        r.close()
+        raise WpaSecSyncError(f"HTTP GET failed for {url}: status {r.status_code}")
+    return r
+
+
+_HEAD_BYTES = 4096
+_CHUNK_BYTES = 1 << 16
+
+
+def _iter_body_lines(r: Response, head: bytearray) -> Iterator[bytes]:
+    """Righe del body in streaming; i primi _HEAD_BYTES byte vengono copiati in head."""
+    lines = r.iter_lines(chunk_size=_CHUNK_BYTES, decode_unicode=False)
+    for line in lines:
+        head += (line + b"\n")[:_HEAD_BYTES - len(head)]
+        yield line
+        if len(head) >= _HEAD_BYTES:
+            break
+    # head pieno: il resto passa senza controlli per riga
+    yield from lines
+
+
+# Errori durante la lettura del body in streaming (iter_lines li rilancia così,
+# anche ProtocolError/ReadTimeoutError di urllib3): il GET è già andato a buon fine
+# e i retry dell'adapter non li coprono.
+_STREAM_ERRORS = (
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.ContentDecodingError,
+)
+
+
+def _download_pot(
+    url: str,
+    source: str,
+    best: Dict[str, str],
+    sink: Optional[Callable[[str, str], None]],
+    **kwargs,
+) -> Optional[Tuple[dict, bytearray]]:
     """
-    Scarica il potfile e ritorna lista dedup di (bssid, password).
+    GET in streaming di url con parsing in best. Ritorna (validators, inizio del body),
+    None con 304. Se la lettura del body si interrompe il download riparte da capo
+    (al massimo STREAM_RETRIES volte, con backoff): best tiene le coppie già lette,
+    quindi sink non le riceve due volte.
+    """
+    for attempt in range(STREAM_RETRIES + 1):
+        head = bytearray()
+        with _http_get_with_retry(url, stream=True, **kwargs) as r:
+            if r.status_code == 304:
+                return None
+            try:
+                parse_pot_lines(_iter_body_lines(r, head), best, sink)
+                return _response_validators(r, source), head
+            except _STREAM_ERRORS as e:
+                error = e
+        # niente url nei messaggi: contiene la chiave
+        if attempt == STREAM_RETRIES:
+            raise WpaSecSyncError(f"Potfile download interrupted: {error}") from error
+        delay = _jittered_backoff(
+            attempt, settings.wpasec_backoff_base, settings.wpasec_backoff_max, settings.wpasec_backoff_jitter
+        )
+        log.warning("Potfile download interrupted (%s), retry in %.1fs", error, delay)
+        time.sleep(delay)
+
+
+def _source_id(base: str, key: str) -> str:
+    # i validatori salvati valgono solo per lo stesso server e la stessa chiave
+    return hashlib.sha256(f"{base}|{key}".encode()).hexdigest()[:16]
+
+
+def _load_validators() -> dict:
+    try:
+        return json.loads(settings.wpasec_cache_file.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_validators(validators: dict) -> None:
+    path = settings.wpasec_cache_file
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(validators), encoding="utf-8")
+    tmp.replace(path)
+
+
+def _conditional_headers(validators: dict) -> Dict[str, str]:
+    headers: Dict[str, str] = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+def _response_validators(r: Response, source: str) -> dict:
+    return {
+        "source": source,
+        "etag": r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified"),
+    }
+
+
+def download_cracked_potfile(
+    validators: Optional[dict] = None,
+    sink: Optional[Callable[[str, str], None]] = None,
+    conditional: bool = True,
+) -> ItemsView[str, str]:
+    """
+    Scarica il potfile e ritorna le coppie dedup (bssid, password).
     Prima tenta query-string ?key=..., poi fallback con cookie=key se serve.
+
+    Se validators (ETag/Last-Modified del download precedente) è passato, la richiesta
+    è condizionale: con 304 ritorna vuoto senza leggere nulla; altrimenti validators
+    viene aggiornato in place con quelli della nuova risposta.
+    Con conditional=False i validators vengono solo aggiornati, la richiesta è completa.
+    sink (opzionale) riceve ogni coppia nuova durante il parsing, vedi parse_pot_lines.
     """
     base = (getattr(settings, "wpasec_url", "") or "https://wpa-sec.stanev.org").rstrip("/")
     key = getattr(settings, "wpasec_key", "") or ""
     if not key:
         raise WpaSecSyncError("PWNMAP_WPASEC_KEY non configurata in settings.wpasec_key")
 
-    def _parse_text(text: str) -> List[Tuple[str, str]]:
-        raw_pairs: List[Tuple[str, str]] = []
-        for line in text.splitlines():
-            parsed = parse_pot_line(line)
-            if parsed:
-                raw_pairs.append(parsed)
-        return _dedup_cracked(raw_pairs)
+    source = _source_id(base, key)
+    headers: Dict[str, str] = {}
+    if conditional and validators is not None and validators.get("source") == source:
+        headers = _conditional_headers(validators)
 
     # 1) Query string
     url_qs = f"{base}/?api&dl=1&key={key}"
-    r = _http_get_with_retry(url_qs)
-    pairs = _parse_text(r.text)
+    best: Dict[str, str] = {}
+    got = _download_pot(url_qs, source, best, sink, headers=headers)
+    if got is None:  # 304
+        return best.items()
+    new_validators, head = got
 
-    # 2) Fallback cookie se vuoto o sembra HTML
-    looks_html = "<html" in r.text.lower() or "</html>" in r.text.lower()
-    if (not pairs) and (looks_html or len(r.text) < 10):
-        headers = {"User-Agent": USER_AGENT}
-        rc = requests.get(f"{base}/?api&dl=1", headers=headers, cookies={"key": key}, timeout=60)
-        rc.raise_for_status()
-        pairs = _parse_text(rc.text)
+    # 2) Fallback cookie se vuoto o sembra HTML (basta l'inizio del body)
+    if (not best) and (len(head) < 10 or _HTML_SNIFF.search(head)):
+        got = _download_pot(f"{base}/?api&dl=1", source, best, sink, cookies={"key": key})
+        if got is not None:
+            new_validators = got[0]
 
-    return pairs
+    if validators is not None:
+        validators.clear()
+        validators.update(new_validators)
+    return best.items()
 
 
 # -----------------------------
 # Sync principale
 # -----------------------------
-def sync_now() -> dict:
+def sync_now(include_pairs: bool = False) -> dict:
     """
     Scarica il potfile, estrae coppie (BSSID, PSK), aggiorna il DB e ritorna:
       {
-        "cracked_pairs_total": int,
+        "not_modified": bool,
+        "cracked_pairs_total": int,   # coppie nel potfile (0 se not_modified)
         "rows_updated": int,
-        "cracked_pairs": [{"bssid": "...", "password": "..."}, ...]
+        "cracked_pairs": [{"bssid": "...", "password": "..."}, ...]   # solo con include_pairs
       }
+    Con include_pairs il download è sempre completo (niente 304), così le coppie ci sono.
     """
-    cracked_pairs = download_cracked_potfile()
+    # Reti inserite dopo l'ultima sync (id più alto cambiato): vanno confrontate con
+    # tutto il potfile, anche se upstream non è cambiato -> niente richiesta condizionale.
+    max_id = max_network_id()
+    validators = _load_validators()
+    previous = dict(validators)
+    conditional = not include_pairs and validators.get("max_id") == max_id
+    # Aggiorna DB a blocchi (transazioni brevi, temp table piccola) in parallelo al parsing
+    pipeline = _UpdatePipeline()
+    try:
+        cracked_pairs = download_cracked_potfile(validators, sink=pipeline.add, conditional=conditional)
+    except BaseException:
+        # l'errore del download resta quello propagato, quello del DB va solo nel log
+        pipeline.close(raise_error=False)
+        raise
+    rows_updated = pipeline.close()
+    # 304: potfile invariato e nessuna rete nuova, niente da aggiornare
+    not_modified = conditional and bool(previous) and validators == previous and not cracked_pairs
+    # max_id letto prima del download: le reti inserite durante la sync forzano la prossima
+    validators["max_id"] = max_id
 
-    # Aggiorna DB
-    rows_updated = bulk_update_passwords(cracked_pairs)
+    # i validatori si salvano solo dopo l'aggiornamento del DB andato a buon fine
+    if validators != previous:
+        try:
+            _save_validators(validators)
+        except OSError as e:
+            log.warning("Impossibile salvare %s: %s", settings.wpasec_cache_file, e)
 
     stats = {
+        "not_modified": not_modified,
         "cracked_pairs_total": len(cracked_pairs),
         "rows_updated": rows_updated,
-        "cracked_pairs": [{"bssid": b, "password": p} for b, p in cracked_pairs],
     }
-
-    # Log di servizio
-    print("[WpaSec Sync] Stats:\n" + json.dumps(stats, indent=2))
+    log.info(
+        "[WpaSec Sync] not_modified=%s cracked_pairs_total=%d rows_updated=%d",
+        not_modified, stats["cracked_pairs_total"], rows_updated,
+    )
+    if include_pairs or log.isEnabledFor(logging.DEBUG):
+        pairs = [{"bssid": b, "password": p} for b, p in cracked_pairs]
+        log.debug("[WpaSec Sync] cracked_pairs: %s", pairs)
+        if include_pairs:
+            stats["cracked_pairs"] = pairs
     return stats
@@ -2,7 +2,9 @@
 # Pwnagotchi plugin: uploads .pcap + .gps.json (ENTRAMBI i file) al backend
 # Versione "low-power essentials" con:
 # - Sleep stop-aware (Event.wait)
-# - requests.Session() con keep-alive
+# - Client HTTP unico con keep-alive (httpx HTTP/2 se presente, altrimenti requests.Session)
+# - Upload a batch: fino a batch_size coppie per POST (fallback a coppie singole)
+# - pcap compresso gzip in invio, opzionale (compress = true; serve un backend che lo decomprima)
 # - Backoff lungo con jitter
 # - File stability check
 # - Check rete agnostico interfaccia (funziona con Wi-Fi, BT tethering, USB)
@@ -14,31 +16,53 @@
 #    poi riportare a 600–900 per risparmio su Zero W.
 #
 #  - Richiede: requests, pwnagotchi.plugins
+#    Opzionale: httpx[http2] (upload su HTTP/2 multiplexato),
+#               inotify_simple (file stability senza sleep)
 
 import os
+import collections
+import gzip
+import shutil
+import tempfile
 import time
-import glob
 import logging
 import threading
 import socket
 import random
-from typing import Set, Tuple, Optional, Dict, Any
+from typing import Set, Tuple, Optional, Dict, Any, List
 
 import requests
+from requests.adapters import HTTPAdapter
 from pwnagotchi import plugins
 
+try:  # opzionale: eventi inotify al posto dello sleep in _file_is_stable (solo Linux)
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+
+try:  # opzionale: HTTP/2 con httpx[http2]
+    import httpx
+    import h2  # noqa: F401  (senza h2 httpx non parla HTTP/2)
+except ImportError:
+    httpx = None
+
 DEFAULT_LIST_PATH = "/home/pi/.pwnamap_uploaded.list"
 DEFAULT_HANDSHAKES_DIR = "/home/pi/handshakes"
 
+# errori di trasporto di entrambi i client
+_HTTP_ERRORS: Tuple[type, ...] = (requests.RequestException,) + ((httpx.HTTPError,) if httpx else ())
+
 
 def read_uploaded_list(path: str) -> Set[str]:
-    paths: Set[str] = set()
-    if os.path.isfile(path):
-        with open(path, "r", encoding="utf-8", errors="ignore") as f:
-            for ln in f:
-                ln = ln.strip()
-                if ln:
-                    paths.add(ln)
+    # lettura in blocco + un solo split; strip per riga come prima (spazi ai bordi),
+    # niente split() sugli spazi: i nomi con spazi interni restano interi
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except (FileNotFoundError, IsADirectoryError):
+        return set()
+    paths = {ln.strip() for ln in data.decode("utf-8", errors="ignore").splitlines()}
+    paths.discard("")
     return paths
 
 
@@ -47,17 +71,54 @@ def append_uploaded_list(path: str, filename: str):
         f.write(filename + "\n")
 
 
-def find_complete_pairs(handshakes_dir: str) -> Set[Tuple[str, str]]:
+# Coppia completa pcap + gps.json; base è il nome del pcap (chiave della uploaded list)
+Pair = collections.namedtuple("Pair", "pcap gps base pcap_size gps_size")
+
+# handshakes_dir -> (mtime_ns della cartella, coppie trovate)
+_pairs_cache: Dict[str, Tuple[int, Set[Pair]]] = {}
+
+
+def find_complete_pairs(handshakes_dir: str) -> Set[Pair]:
     """
-    Ritorna insieme di (pcap_path, gps_json_path) SOLO se entrambi esistono.
+    Ritorna insieme di Pair (pcap, gps.json, nome, dimensioni) SOLO se entrambi esistono.
     Considera .pcap e <base>.gps.json.
+    Una sola passata os.scandir; se l'mtime della cartella non è cambiato
+    (nessun file aggiunto/rimosso/rinominato) riusa il risultato precedente.
     """
-    pairs: Set[Tuple[str, str]] = set()
-    for pcap in glob.glob(os.path.join(handshakes_dir, "*.pcap")):
-        base = os.path.splitext(os.path.basename(pcap))[0]
-        gps = os.path.join(handshakes_dir, base + ".gps.json")
-        if os.path.isfile(gps):
-            pairs.add((pcap, gps))
+    try:
+        st = os.stat(handshakes_dir)
+    except OSError:
+        return set()
+    cached = _pairs_cache.get(handshakes_dir)
+    if cached is not None and cached[0] == st.st_mtime_ns:
+        return cached[1]
+
+    pcaps: Dict[str, os.DirEntry] = {}
+    gpses: Dict[str, os.DirEntry] = {}
+    with os.scandir(handshakes_dir) as it:
+        for e in it:
+            n = e.name
+            if n.endswith(".pcap"):
+                if e.is_file():
+                    pcaps[n[:-5]] = e
+            elif n.endswith(".gps.json"):
+                if e.is_file():
+                    gpses[n[:-9]] = e
+    pairs: Set[Pair] = set()
+    for stem in pcaps.keys() & gpses.keys():
+        pe, ge = pcaps[stem], gpses[stem]
+        try:
+            pairs.add(Pair(pe.path, ge.path, pe.name, pe.stat().st_size, ge.stat().st_size))
+        except OSError:  # rimosso nel frattempo
+            continue
+
+    # mtime a granularità grossa (es. FAT): una modifica nello stesso tick non lo cambierebbe.
+    # Un file ancora vuoto crescerà senza toccare la cartella: niente cache finché ce n'è uno.
+    if (time.time_ns() - st.st_mtime_ns > 2_000_000_000
+            and all(p.pcap_size and p.gps_size for p in pairs)):
+        _pairs_cache[handshakes_dir] = (st.st_mtime_ns, pairs)
+    else:
+        _pairs_cache.pop(handshakes_dir, None)
     return pairs
 
 
@@ -87,11 +148,60 @@ def _url_host(url: str) -> Optional[str]:
         return None
 
 
-def _file_is_stable(path: str, min_age_s: float = 5.0, recheck_delay_s: float = 1.0) -> bool:
+def _gzip_spooled(path: str) -> tempfile.SpooledTemporaryFile:
+    """Copia gzip (livello 1, veloce su ARM) di path: in RAM fino a 1 MiB, poi su disco."""
+    tmp = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    try:
+        with open(path, "rb") as src, gzip.GzipFile(fileobj=tmp, mode="wb", compresslevel=1, mtime=0) as gz:
+            shutil.copyfileobj(src, gz, 64 * 1024)
+    except Exception:
+        tmp.close()
+        raise
+    tmp.seek(0)
+    return tmp
+
+
+class _CloseWriteWatcher:
+    """
+    inotify (IN_CLOSE_WRITE | IN_MOVED_TO) sulla cartella handshakes:
+    un file segnalato è già stato chiuso dallo scrittore, quindi è completo.
+    Una nuova scrittura (IN_MODIFY) o la rimozione lo tolgono di nuovo.
+    """
+
+    def __init__(self, directory: str):
+        self._inotify = INotify()
+        self._inotify.add_watch(
+            directory,
+            inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO
+            | inotify_flags.MODIFY | inotify_flags.DELETE | inotify_flags.MOVED_FROM,
+        )
+        self._closed: Set[str] = set()
+
+    def is_closed(self, name: str) -> bool:
+        for ev in self._inotify.read(timeout=0):  # non bloccante, eventi in ordine
+            if not ev.name:
+                continue
+            if ev.mask & (inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO):
+                self._closed.add(ev.name)
+            else:  # riaperto in scrittura, cancellato o spostato via
+                self._closed.discard(ev.name)
+        return name in self._closed
+
+    def forget(self, *names: str):
+        # dopo l'upload il file non serve più: l'insieme non cresce all'infinito
+        self._closed.difference_update(names)
+
+    def close(self):
+        self._inotify.close()
+
+
+def _file_is_stable(path: str, min_age_s: float = 5.0, recheck_delay_s: float = 1.0,
+                    watcher: Optional[_CloseWriteWatcher] = None) -> bool:
     """
     Considera "stabile" se:
       - mtime è più vecchio di min_age_s, oppure
-      - size e mtime non cambiano tra due letture distanziate di recheck_delay_s.
+      - (con watcher inotify) il file è già stato chiuso in scrittura, oppure
+      - (senza watcher) size e mtime non cambiano tra due letture distanziate di recheck_delay_s.
     """
     try:
         st1 = os.stat(path)
@@ -100,6 +210,9 @@ def _file_is_stable(path: str, min_age_s: float = 5.0, recheck_delay_s: float =
     now = time.time()
     if now - st1.st_mtime >= min_age_s:
         return True
+    if watcher is not None:
+        # niente sleep: se non è ancora chiuso si riprova al prossimo giro
+        return watcher.is_closed(os.path.basename(path))
     time.sleep(recheck_delay_s)
     try:
         st2 = os.stat(path)
@@ -108,18 +221,79 @@ def _file_is_stable(path: str, min_age_s: float = 5.0, recheck_delay_s: float =
     return (st1.st_size == st2.st_size) and (st1.st_mtime == st2.st_mtime)
 
 
+# TCP keep-alive sui socket del client: la connessione resta valida tra un ciclo e l'altro
+_KEEPALIVE_OPTS: List[Tuple[int, int, int]] = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+if hasattr(socket, "TCP_KEEPIDLE"):  # Linux
+    _KEEPALIVE_OPTS.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60))
+
+
+class _KeepAliveAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = [(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)] + _KEEPALIVE_OPTS
+        super().init_poolmanager(*args, **kwargs)
+
+
+def _make_http_client(verify_ssl: bool = True):
+    """
+    Client HTTP riusato per tutta la vita del worker.
+    httpx con HTTP/2 se disponibile (httpx + h2), altrimenti
+    requests.Session con pool urllib3 dimensionato.
+    """
+    if httpx is not None:
+        transport = httpx.HTTPTransport(
+            http2=True,
+            verify=verify_ssl,
+            limits=httpx.Limits(max_keepalive_connections=4, max_connections=8),
+            socket_options=_KEEPALIVE_OPTS,
+        )
+        return httpx.Client(transport=transport)
+    session = requests.Session()
+    session.verify = verify_ssl
+    adapter = _KeepAliveAdapter(pool_connections=2, pool_maxsize=4)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
 # --- Check rete agnostico interfaccia (Wi-Fi, bnep0, USB, ecc.) ---
+_DNS_TTL_S = 60.0
+# (host, port) -> (risultati getaddrinfo, scadenza monotonic)
+_dns_cache: Dict[Tuple[str, int], Tuple[List[tuple], float]] = {}
+
+
+def _resolve(host: str, port: int) -> List[tuple]:
+    """getaddrinfo (solo TCP) con cache di _DNS_TTL_S secondi."""
+    key = (host, port)
+    now = time.monotonic()
+    hit = _dns_cache.get(key)
+    if hit is not None and hit[1] > now:
+        return hit[0]
+    infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    _dns_cache[key] = (infos, now + _DNS_TTL_S)
+    return infos
+
+
 def _net_ok(url: str, timeout: float = 2.0) -> bool:
     host = _url_host(url)
     if not host:
         return True
     port = 443 if url.lower().startswith("https://") else 80
     try:
-        # Risolve DNS e apre TCP; se va, la rete è OK per l'upload.
-        with socket.create_connection((host, port), timeout=timeout):
-            return True
+        infos = _resolve(host, port)
     except OSError:
         return False
+    # Apre TCP verso il primo indirizzo che risponde; se va, la rete è OK per l'upload.
+    for family, type_, proto, _, sockaddr in infos:
+        try:
+            with socket.socket(family, type_, proto) as s:
+                s.settimeout(timeout)
+                s.connect(sockaddr)
+            return True
+        except OSError:
+            continue
+    # indirizzo forse cambiato (o rete giù): al prossimo giro si risolve di nuovo
+    _dns_cache.pop((host, port), None)
+    return False
 
 
 class PwnamapUploader(plugins.Plugin):
@@ -134,8 +308,9 @@ class PwnamapUploader(plugins.Plugin):
         self._uploaded: Set[str] = set()
         self._lock = threading.Lock()
         self.options: Dict[str, Any] = {}
-        self._session: Optional[requests.Session] = None
+        self._session: Any = None  # httpx.Client o requests.Session
         self._ui_uploading = False  # evita flip UI ridondanti
+        self._batch_ok = True  # False se il backend non ha /upload/batch
 
     def on_loaded(self):
         logging.info("[pwnamap_uploader] plugin loaded")
@@ -196,20 +371,82 @@ class PwnamapUploader(plugins.Plugin):
             "User-Agent": "pwnamap-uploader/0.5.1-essentials (+pwnagotchi)"
         }
 
-        # Session HTTP riutilizzabile
-        self._session = requests.Session()
+        # Client HTTP riutilizzabile (keep-alive, HTTP/2 se possibile)
+        self._session = _make_http_client(verify_ssl)
+
+        # File stability via inotify se disponibile, altrimenti polling con stat
+        watcher: Optional[_CloseWriteWatcher] = None
+        if INotify is not None:
+            try:
+                watcher = _CloseWriteWatcher(handshakes_dir)
+            except OSError as e:
+                logging.debug("[pwnamap_uploader] inotify unavailable (%s), using stat polling.", e)
 
         # Backoff con jitter
         backoff = 2
         max_backoff = int(self.options.get("max_backoff_sec", 1800))  # fino a 30 min
 
+        # Batch: più coppie per POST su <server_url>/batch (campi pcap_i/gps_i)
+        batch_size = max(1, int(self.options.get("batch_size", 8)))
+        batch_url = self.options.get("batch_url") or server_url.rstrip("/") + "/batch"
+        # pcap compresso gzip prima dell'invio (solo se richiesto: il backend deve
+        # riconoscerlo e decomprimerlo, altrimenti si torna all'invio in chiaro)
+        compress = _parse_bool(self.options.get("compress"), default=False)
+
         def stop_aware_wait(seconds: float):
             # dorme ma si sveglia prontamente se arriva stop
             self._stop.wait(seconds)
 
-        def upload_pair(pcap_path: str, gps_path: str) -> bool:
+        def backoff_wait():
             nonlocal backoff
-            base = os.path.basename(pcap_path)
+            jitter = random.uniform(0.8, 1.2)
+            stop_aware_wait(min(max_backoff, backoff) * jitter)
+            backoff = min(max_backoff, max(4, backoff * 2))
+
+        def pair_is_stable(pair: Pair) -> bool:
+            return _file_is_stable(pair.pcap, watcher=watcher) and _file_is_stable(pair.gps, watcher=watcher)
+
+        def mark_uploaded(pair: Pair):
+            append_uploaded_list(ul, pair.base)
+            self._uploaded.add(pair.base)
+            if watcher is not None:
+                watcher.forget(os.path.basename(pair.pcap), os.path.basename(pair.gps))
+
+        def open_pair(pair: Pair, suffix: str = "") -> Optional[List[Tuple[str, tuple]]]:
+            # Prepara i campi multipart con ENTRAMBI i file (None se uno manca o è vuoto)
+            if pair.pcap_size <= 0 or pair.gps_size <= 0:
+                logging.warning("[pwnamap_uploader] Skipping %s: %s empty", pair.base,
+                                "pcap" if pair.pcap_size <= 0 else "gps json")
+                return None
+            try:
+                fp = _gzip_spooled(pair.pcap) if compress else open(pair.pcap, "rb")
+            except Exception as e:
+                logging.warning("[pwnamap_uploader] Unable to open pcap %s: %s", pair.pcap, e)
+                return None
+            try:
+                fg = open(pair.gps, "rb")
+            except Exception as e:
+                logging.warning("[pwnamap_uploader] Unable to open gps %s: %s", pair.gps, e)
+                fp.close()
+                return None
+            pcap_part: tuple = (pair.base, fp)
+            if compress:
+                pcap_part += ("application/vnd.tcpdump.pcap", {"Content-Encoding": "gzip"})
+            return [
+                ("pcap" + suffix, pcap_part),
+                ("gps" + suffix, (pair.base[:-5] + ".gps.json", fg, "application/json")),
+            ]
+
+        def close_files(files: List[Tuple[str, tuple]]):
+            for _, v in files:
+                try:
+                    v[1].close()
+                except Exception:
+                    pass
+
+        def upload_pair(pair: Pair) -> bool:
+            nonlocal backoff, compress
+            base = pair.base
 
             # Connettività: prova TCP al server (copre Wi-Fi, BT tethering, ecc.)
             if not _net_ok(server_url):
@@ -217,31 +454,15 @@ class PwnamapUploader(plugins.Plugin):
                 return False
 
             # File stability check
-            if not _file_is_stable(pcap_path) or not _file_is_stable(gps_path):
+            if not pair_is_stable(pair):
                 logging.debug("[pwnamap_uploader] files not stable yet, will retry.")
                 return False
 
-            # Prepara multipart con ENTRAMBI i file
-            files = {}
-            try:
-                files["pcap"] = (os.path.basename(pcap_path), open(pcap_path, "rb"))
-                if os.path.getsize(pcap_path) <= 0:
-                    raise IOError("pcap empty")
-            except Exception as e:
-                logging.warning("[pwnamap_uploader] Unable to open pcap %s: %s", pcap_path, e)
-                return False
-            try:
-                files["gps"] = (os.path.basename(gps_path), open(gps_path, "rb"), "application/json")
-                if os.path.getsize(gps_path) <= 0:
-                    raise IOError("gps json empty")
-            except Exception as e:
-                logging.warning("[pwnamap_uploader] Unable to open gps %s: %s", gps_path, e)
-                try:
-                    files["pcap"][1].close()
-                except Exception:
-                    pass
+            files = open_pair(pair)
+            if files is None:
                 return False
 
+            gzipped = compress
             self._set_ui_state(agent, uploading=True)
             try:
                 resp = self._session.post(
@@ -250,35 +471,109 @@ class PwnamapUploader(plugins.Plugin):
                     data={},          # inviamo il file intero
                     headers=headers,
                     timeout=60,
-                    verify=verify_ssl,
                 )
                 if 200 <= resp.status_code < 300:
-                    append_uploaded_list(ul, base)
-                    self._uploaded.add(base)
+                    mark_uploaded(pair)
                     backoff = 2
                     logging.info("[pwnamap_uploader] Uploaded %s (+gps).", base)
                     return True
+                elif gzipped and resp.status_code in (400, 415):
+                    # backend che non decomprime (o proxy che rifiuta l'encoding): da qui in poi in chiaro
+                    logging.warning("[pwnamap_uploader] Compressed upload rejected (HTTP %s), "
+                                    "retrying uncompressed.", resp.status_code)
+                    compress = False
                 else:
                     logging.warning("[pwnamap_uploader] Upload failed HTTP %s", resp.status_code)
-                    jitter = random.uniform(0.8, 1.2)
-                    stop_aware_wait(min(max_backoff, backoff) * jitter)
-                    backoff = min(max_backoff, max(4, backoff * 2))
+                    backoff_wait()
                     return False
-            except requests.RequestException as e:
+            except _HTTP_ERRORS as e:
                 logging.warning("[pwnamap_uploader] Upload error: %s", e)
-                jitter = random.uniform(0.8, 1.2)
-                stop_aware_wait(min(max_backoff, backoff) * jitter)
-                backoff = min(max_backoff, max(4, backoff * 2))
+                backoff_wait()
                 return False
             finally:
-                try:
-                    for v in files.values():
-                        if isinstance(v, tuple) and len(v) >= 2 and hasattr(v[1], "close"):
-                            v[1].close()
-                except Exception:
-                    pass
+                close_files(files)
+            return upload_pair(pair)  # solo dopo un rifiuto del pcap gzip
             # end upload_pair
 
+        def upload_batch(batch: List[Pair]) -> Optional[int]:
+            """Carica più coppie in un POST. Ritorna quante sono andate, None se il server non supporta il batch."""
+            nonlocal backoff
+            if not _net_ok(server_url):
+                logging.debug("[pwnamap_uploader] network not reachable for %s, skip.", server_url)
+                return 0
+
+            files: List[Tuple[str, tuple]] = []
+            sent: List[Pair] = []
+            for pair in batch:
+                if not pair_is_stable(pair):
+                    logging.debug("[pwnamap_uploader] files not stable yet, will retry.")
+                    continue
+                opened = open_pair(pair, "_%d" % len(sent))
+                if opened:
+                    files.extend(opened)
+                    sent.append(pair)
+            if not sent:
+                return 0
+
+            self._set_ui_state(agent, uploading=True)
+            try:
+                resp = self._session.post(
+                    batch_url,
+                    files=files,
+                    headers=headers,
+                    timeout=60 * len(sent),
+                )
+            except _HTTP_ERRORS as e:
+                logging.warning("[pwnamap_uploader] Batch upload error: %s", e)
+                backoff_wait()
+                return 0
+            finally:
+                close_files(files)
+
+            if resp.status_code in (404, 405):
+                # backend senza /upload/batch: si torna alle coppie singole
+                logging.info("[pwnamap_uploader] Batch upload HTTP %s, falling back to single uploads.",
+                             resp.status_code)
+                self._batch_ok = False
+                return None
+            if resp.status_code == 413 and len(sent) > 1:
+                # corpo oltre il limite del server/proxy: si riprova in due metà
+                logging.info("[pwnamap_uploader] Batch of %d pairs too large (HTTP 413), splitting.", len(sent))
+                half = len(sent) // 2
+                done = 0
+                for part in (sent[:half], sent[half:]):
+                    n = upload_batch(part)
+                    if n is None:
+                        return None
+                    done += n
+                return done
+            if not 200 <= resp.status_code < 300:
+                logging.warning("[pwnamap_uploader] Batch upload failed HTTP %s", resp.status_code)
+                backoff_wait()
+                return 0
+
+            try:
+                results = resp.json().get("results") or []
+            except ValueError:
+                results = []
+            done = 0
+            for res in results:
+                if not isinstance(res, dict):
+                    continue
+                idx = res.get("index")
+                if res.get("ok") and isinstance(idx, int) and 0 <= idx < len(sent):
+                    mark_uploaded(sent[idx])
+                    done += 1
+                    logging.info("[pwnamap_uploader] Uploaded %s (+gps).", sent[idx].base)
+                else:
+                    logging.warning("[pwnamap_uploader] Upload of %s rejected: %s",
+                                    res.get("filename"), res.get("detail"))
+            if done == len(sent):
+                backoff = 2
+            else:
+                backoff_wait()
+            return done
+
         # Jitter di startup (0–30s) per evitare stampede
         self._stop.wait(random.uniform(0, 30))
 
@@ -286,22 +581,38 @@ class PwnamapUploader(plugins.Plugin):
         while not self._stop.is_set():
             had_work = False
             pairs = find_complete_pairs(handshakes_dir)  # no sorted()
+            pending = [p for p in pairs if p.base not in self._uploaded]
+
+            if batch_size > 1 and self._batch_ok:
+                for i in range(0, len(pending), batch_size):
+                    batch = pending[i:i + batch_size]
+                    # Fino a 5 tentativi in questa passata per le coppie del batch ancora da caricare
+                    attempts = 0
+                    while attempts < 5 and batch and self._batch_ok and not self._stop.is_set():
+                        done = upload_batch(batch)
+                        attempts += 1
+                        if done:
+                            had_work = True
+                        batch = [p for p in batch if p.base not in self._uploaded]
+                    if self._stop.is_set() or not self._batch_ok:
+                        break
 
-            for pcap_path, gps_path in pairs:
-                if self._stop.is_set():
-                    break
-                base = os.path.basename(pcap_path)
-                if base in self._uploaded:
-                    continue
-                # Fino a 5 tentativi in questa passata
-                attempts = 0
-                while attempts < 5 and base not in self._uploaded and not self._stop.is_set():
-                    self._set_ui_state(agent, uploading=True)
-                    ok = upload_pair(pcap_path, gps_path)
-                    attempts += 1
-                    if ok:
-                        had_work = True
+            if batch_size <= 1 or not self._batch_ok:
+                for pair in pending:
+                    if self._stop.is_set():
                         break
+                    base = pair.base
+                    if base in self._uploaded:
+                        continue
+                    # Fino a 5 tentativi in questa passata
+                    attempts = 0
+                    while attempts < 5 and base not in self._uploaded and not self._stop.is_set():
+                        self._set_ui_state(agent, uploading=True)
+                        ok = upload_pair(pair)
+                        attempts += 1
+                        if ok:
+                            had_work = True
+                            break
 
             # UI a riposo se non c'è lavoro
             if not had_work:
@@ -314,6 +625,8 @@ class PwnamapUploader(plugins.Plugin):
                 self._stop.wait(max(5, interval))
 
         # cleanup
+        if watcher is not None:
+            watcher.close()
         self._set_ui_state(agent, uploading=False)
 
     def on_unload(self, ui):
@@ -0,0 +1,16 @@
+import os
+import tempfile
+
+# backend.core.settings legge la configurazione all'import: valori minimi
+# per i test, senza toccare un eventuale .env o le variabili già impostate
+_tmp = tempfile.mkdtemp(prefix="pwnmap-test-")
+for key, value in {
+    "SERVER_BIND": "127.0.0.1",
+    "SERVER_PORT": "8000",
+    "WPASEC_URL": "http://wpa-sec.invalid",
+    "WPASEC_KEY": "test",
+    "DATA_DIR": _tmp,
+    "DB_PATH": os.path.join(_tmp, "pwnmap.sqlite"),
+    "VENDOR_OUI_CSV": os.path.join(_tmp, "oui.csv"),
+}.items():
+    os.environ.setdefault("PWNMAP_" + key, value)
@@ -0,0 +1,63 @@
+import sqlite3
+
+import orjson
+import pytest
+
+from backend.core.settings import settings
+from backend.db import queries
+from backend.db.database import db_conn
+from backend.db.queries import insert_network_records, max_network_id, select_networks_geojson
+
+
+@pytest.fixture(scope="module", autouse=True)
+def networks():
+    rows = [
+        dict(ssid=f"net{i}", hash_type="WPA", hash_variant="EAPOL",
+             bssid="AA:BB:CC:00:%02X:%02X" % divmod(i, 256), vendor=None,
+             date="2024-01-01", time="00:00:%02d" % (i % 60),
+             lat=45.0 + i / 1e4, lon=9.0, alt=None, accuracy=None,
+             password="pw" if i % 2 else None)
+        for i in range(1200)
+    ]
+    insert_network_records(rows)
+
+
+def test_streams_valid_feature_collection(monkeypatch):
+    monkeypatch.setattr(queries, "_GEOJSON_FETCH_ROWS", 100)
+    body = b"".join(select_networks_geojson(limit=50000))
+    fc = orjson.loads(body)
+    assert fc["type"] == "FeatureCollection"
+    assert len(fc["features"]) >= 1200
+    assert {f["properties"]["status"] for f in fc["features"]} == {"cracked", "unknown"}
+
+
+def test_empty_result():
+    body = b"".join(select_networks_geojson(q="no-such-network-anywhere"))
+    assert orjson.loads(body) == {"type": "FeatureCollection", "features": []}
+
+
+def test_query_error_is_raised_before_streaming(monkeypatch):
+    monkeypatch.setattr(queries, "_build_geojson_sql", lambda *a: "SELECT * FROM missing_table")
+    with pytest.raises(sqlite3.OperationalError):
+        select_networks_geojson()
+
+
+def test_open_stream_does_not_pin_a_snapshot():
+    chunks = select_networks_geojson(limit=50000)
+    next(chunks)
+    before = max_network_id()
+    insert_network_records([
+        dict(ssid=f"late{i}", hash_type=None, hash_variant=None,
+             bssid="AA:BB:CC:FF:00:%02X" % i, vendor=None,
+             date="2024-01-02", time="00:00:00",
+             lat=45.0, lon=9.0, alt=None, accuracy=None, password=None)
+        for i in range(10)
+    ])
+    # tutte le connessioni RO del pool vedono le righe nuove
+    counts = set()
+    for _ in range(2 * settings.db_read_connections):
+        with db_conn() as conn:
+            counts.add(conn.execute("SELECT COUNT(*) FROM networks WHERE ssid LIKE 'late%'").fetchone()[0])
+    assert counts == {10}
+    assert max_network_id() == before + 10
+    b"".join(chunks)
@@ -0,0 +1,144 @@
+import struct
+
+import pytest
+
+from backend.services.pcap_parse import extract_hashes
+
+AP = bytes.fromhex("aabbccddeeff")
+STA = bytes.fromhex("112233445566")
+ESSID = b"testnet"
+PMKID = bytes.fromhex("0102030405060708090a0b0c0d0e0f10")
+ANONCE = bytes(range(32))
+REPLAY = struct.pack(">Q", 1)
+MIC = bytes.fromhex("a1" * 16)
+
+LLC_SNAP_EAPOL = b"\xaa\xaa\x03\x00\x00\x00\x88\x8e"
+
+
+# ---------- costruzione frame 802.11 ----------
+
+def beacon() -> bytes:
+    hdr = b"\x80\x00" + b"\x00\x00" + b"\xff" * 6 + AP + AP + b"\x00\x00"
+    fixed = bytes(8) + b"\x64\x00" + b"\x11\x04"
+    return hdr + fixed + b"\x00" + bytes([len(ESSID)]) + ESSID
+
+
+def eapol_key(key_info: int, nonce: bytes, mic: bytes, key_data: bytes = b"") -> bytes:
+    body = (
+        b"\x02" + struct.pack(">H", key_info) + b"\x00\x10" + REPLAY + nonce
+        + bytes(16) + bytes(8) + bytes(8) + mic + struct.pack(">H", len(key_data)) + key_data
+    )
+    return b"\x02\x03" + struct.pack(">H", len(body)) + body
+
+
+def m1(with_pmkid: bool = True) -> bytes:
+    key_data = b"\xdd\x14\x00\x0f\xac\x04" + PMKID if with_pmkid else b""
+    hdr = b"\x08\x02" + b"\x00\x00" + STA + AP + AP + b"\x00\x00"  # from DS
+    return hdr + LLC_SNAP_EAPOL + eapol_key(0x008A, ANONCE, bytes(16), key_data)
+
+
+def m2() -> bytes:
+    hdr = b"\x08\x01" + b"\x00\x00" + AP + STA + AP + b"\x00\x00"  # to DS
+    return hdr + LLC_SNAP_EAPOL + eapol_key(0x010A, bytes(32), MIC)
+
+
+def radiotap(frame: bytes) -> bytes:
+    return b"\x00\x00" + struct.pack("<H", 8) + bytes(4) + frame
+
+
+# ---------- contenitori pcap / pcapng ----------
+
+def pcap(frames, linktype: int = 105) -> bytes:
+    out = struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, linktype)
+    for f in frames:
+        out += struct.pack("<IIII", 0, 0, len(f), len(f)) + f
+    return out
+
+
+def _block(btype: int, body: bytes) -> bytes:
+    body += bytes(-len(body) % 4)
+    total = len(body) + 12
+    return struct.pack("<II", btype, total) + body + struct.pack("<I", total)
+
+
+def pcapng(frames, linktype: int = 105) -> bytes:
+    out = _block(0x0A0D0D0A, struct.pack("<IHHq", 0x1A2B3C4D, 1, 0, -1))
+    out += _block(1, struct.pack("<HHI", linktype, 0, 65535))
+    for f in frames:
+        out += _block(6, struct.pack("<IIIII", 0, 0, 0, len(f), len(f)) + f)
+    return out
+
+
+def expected_eapol_line() -> str:
+    zeroed = eapol_key(0x010A, bytes(32), bytes(16))
+    return (
+        f"WPA*02*{MIC.hex()}*{AP.hex()}*{STA.hex()}*{ESSID.hex()}"
+        f"*{ANONCE.hex()}*{zeroed.hex()}*00"
+    )
+
+
+def expected_pmkid_line() -> str:
+    return f"WPA*01*{PMKID.hex()}*{AP.hex()}*{STA.hex()}*{ESSID.hex()}***"
+
+
+def _write(tmp_path, data: bytes):
+    p = tmp_path / "cap.pcap"
+    p.write_bytes(data)
+    return p
+
+
+# ---------- test ----------
+
+@pytest.mark.parametrize("container", [pcap, pcapng])
+def test_pmkid_and_eapol(tmp_path, container):
+    recs = extract_hashes(_write(tmp_path, container([beacon(), m1(), m2()])))
+    assert [r["variant"] for r in recs] == ["PMKID", "EAPOL"]
+    assert recs[0]["line"] == expected_pmkid_line()
+    assert recs[1]["line"] == expected_eapol_line()
+    assert all(r["bssid"] == AP.hex() and r["essid"] == ESSID.hex() for r in recs)
+
+
+@pytest.mark.parametrize("container", [pcap, pcapng])
+def test_radiotap(tmp_path, container):
+    frames = [radiotap(f) for f in (beacon(), m1(with_pmkid=False), m2())]
+    recs = extract_hashes(_write(tmp_path, container(frames, linktype=127)))
+    assert [r["line"] for r in recs] == [expected_eapol_line()]
+
+
+def test_m2_without_m1_is_ignored(tmp_path):
+    assert extract_hashes(_write(tmp_path, pcap([beacon(), m2()]))) == []
+
+
+def test_unknown_essid_is_skipped(tmp_path):
+    assert extract_hashes(_write(tmp_path, pcap([m1(), m2()]))) == []
+
+
+def test_truncated_pcap_keeps_earlier_frames(tmp_path):
+    data = pcap([beacon(), m1(), m2()])
+    recs = extract_hashes(_write(tmp_path, data[:-40]))  # M2 tagliato
+    assert [r["variant"] for r in recs] == ["PMKID"]
+
+
+def test_truncated_pcapng_keeps_earlier_frames(tmp_path):
+    data = pcapng([beacon(), m1(), m2()])
+    recs = extract_hashes(_write(tmp_path, data[:-40]))
+    assert [r["variant"] for r in recs] == ["PMKID"]
+
+
+@pytest.mark.parametrize("btype", [1, 6])
+def test_short_pcapng_blocks_do_not_raise(tmp_path, btype):
+    data = pcapng([beacon(), m1()])
+    # blocco IDB/EPB con corpo più corto dell'header fisso
+    data += struct.pack("<II", btype, 16) + bytes(4) + struct.pack("<I", 16)
+    recs = extract_hashes(_write(tmp_path, data))
+    assert [r["variant"] for r in recs] == ["PMKID"]
+
+
+def test_truncated_eapol_frame_is_skipped(tmp_path):
+    recs = extract_hashes(_write(tmp_path, pcap([beacon(), m1()[:60], m2()])))
+    assert recs == []
+
+
+def test_not_a_capture(tmp_path):
+    with pytest.raises(ValueError):
+        extract_hashes(_write(tmp_path, b"definitely not a pcap"))
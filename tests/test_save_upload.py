@@ -0,0 +1,44 @@
+import gzip
+import io
+
+import pytest
+
+from backend.routers import upload
+from backend.routers.upload import _save_upload
+
+PCAP = b"\xd4\xc3\xb2\xa1" + bytes(1000)
+
+
+def test_gzip_is_decompressed(tmp_path):
+    dst = tmp_path / "a.pcap"
+    _save_upload(io.BytesIO(gzip.compress(PCAP)), dst)
+    assert dst.read_bytes() == PCAP
+
+
+def test_plain_copy(tmp_path):
+    dst = tmp_path / "a.pcap"
+    _save_upload(io.BytesIO(PCAP), dst)
+    assert dst.read_bytes() == PCAP
+
+
+def test_gzip_at_limit_is_accepted(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload, "MAX_GUNZIP_BYTES", len(PCAP))
+    dst = tmp_path / "a.pcap"
+    _save_upload(io.BytesIO(gzip.compress(PCAP)), dst)
+    assert dst.read_bytes() == PCAP
+
+
+def test_gzip_bomb_is_rejected(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload, "MAX_GUNZIP_BYTES", 1 << 20)
+    bomb = gzip.compress(bytes(8 << 20))  # 8 MiB di zeri in pochi KB
+    dst = tmp_path / "a.pcap"
+    with pytest.raises(ValueError):
+        _save_upload(io.BytesIO(bomb), dst)
+    assert not dst.exists()
+
+
+def test_corrupt_gzip_is_rejected(tmp_path):
+    dst = tmp_path / "a.pcap"
+    with pytest.raises(ValueError):
+        _save_upload(io.BytesIO(gzip.compress(PCAP)[:-20]), dst)
+    assert not dst.exists()
@@ -0,0 +1,59 @@
+import struct
+from contextlib import asynccontextmanager
+
+import orjson
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.core.security import require_admin
+from backend.db import writer
+from backend.routers import upload
+
+PCAP = struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, 105)
+
+
+def _gps(second: int) -> bytes:
+    return orjson.dumps({"Updated": "2024-05-01T10:00:%02dZ" % second, "Latitude": 45.0, "Longitude": 9.0})
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # le catture vanno in data/captures relativo alla cwd
+
+    @asynccontextmanager
+    async def lifespan(app):
+        writer.start_writer()
+        yield
+        await writer.stop_writer()
+
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(upload.router)
+    app.dependency_overrides[require_admin] = lambda: True
+    with TestClient(app) as c:
+        yield c
+
+
+def test_batch_inserts_in_one_transaction(client, monkeypatch):
+    batches = []
+    real = writer.insert_network_records
+
+    def spy(rows):
+        batches.append(len(rows))
+        return real(rows)
+
+    monkeypatch.setattr(writer, "insert_network_records", spy)
+    files = []
+    for i in range(6):
+        files.append((f"pcap_{i}", (f"batchnet{i}_1.pcap", PCAP, "application/octet-stream")))
+        files.append((f"gps_{i}", (f"batchnet{i}_1.gps.json", _gps(i), "application/json")))
+    files.append(("pcap_6", ("broken.pcap", PCAP, "application/octet-stream")))
+    files.append(("gps_6", ("broken.gps.json", b"{}", "application/json")))
+
+    r = client.post("/api/upload/batch", files=files)
+    assert r.status_code == 200
+    results = r.json()["results"]
+    assert [res["index"] for res in results] == list(range(7))
+    assert all(res["ok"] and res["record_id"] > 0 for res in results[:6])
+    assert results[6]["ok"] is False and results[6]["status"] == 400
+    assert batches == [6]
@@ -0,0 +1,98 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from backend.core.settings import settings
+from backend.services import wpasec_sync
+from backend.services.wpasec_sync import WpaSecSyncError, download_cracked_potfile, sync_now
+
+POTFILE = b"".join(
+    b"aabbccdd%04x:112233445566:net:pw%d\n" % (i, i) for i in range(2000)
+)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    truncate = 0  # quante risposte troncare prima di quella completa
+    requests = []
+
+    def do_GET(self):
+        cls = type(self)
+        cls.requests.append(dict(self.headers))
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(POTFILE)))
+        self.send_header("Set-Cookie", "session=abc; Path=/")
+        self.end_headers()
+        if cls.truncate:
+            cls.truncate -= 1
+            self.wfile.write(POTFILE[: len(POTFILE) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(POTFILE)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch, tmp_path):
+    _Handler.requests = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    t = threading.Thread(target=httpd.serve_forever, daemon=True)
+    t.start()
+    monkeypatch.setattr(settings, "wpasec_url", "http://127.0.0.1:%d" % httpd.server_port)
+    monkeypatch.setattr(settings, "wpasec_backoff_base", 0.0)
+    monkeypatch.setattr(settings, "wpasec_cache_file", tmp_path / "wpasec_cache.json")
+    yield _Handler
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_truncated_body_is_retried(server):
+    server.truncate = 2
+    seen = []
+    pairs = dict(download_cracked_potfile(sink=lambda b, p: seen.append(b)))
+    assert len(pairs) == 2000
+    assert len(seen) == len(set(seen)) == 2000  # nessuna coppia inviata due volte
+    assert len(server.requests) == 3
+
+
+def test_truncated_body_gives_up(server):
+    server.truncate = wpasec_sync.STREAM_RETRIES + 1
+    with pytest.raises(WpaSecSyncError):
+        download_cracked_potfile()
+
+
+def test_cookies_are_not_kept(server):
+    download_cracked_potfile()
+    download_cracked_potfile()
+    assert all("Cookie" not in h for h in server.requests)
+    assert not wpasec_sync._SESSION.cookies
+
+
+def test_include_pairs_skips_conditional_request(server):
+    assert sync_now()["not_modified"] is False
+    assert sync_now()["not_modified"] is True
+    stats = sync_now(include_pairs=True)
+    assert stats["not_modified"] is False
+    assert stats["cracked_pairs_total"] == len(stats["cracked_pairs"]) == 2000
+    assert "If-None-Match" not in server.requests[-1]
+
+
+def test_download_error_is_not_masked_by_db_error(server, monkeypatch):
+    def broken(items):
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(wpasec_sync, "bulk_update_passwords", broken)
+    monkeypatch.setattr(wpasec_sync, "_CHUNK_BYTES", 1024)  # righe lette prima del taglio
+    server.truncate = wpasec_sync.STREAM_RETRIES + 1
+    with pytest.raises(WpaSecSyncError):
+        sync_now()
+    server.truncate = 0
+    with pytest.raises(RuntimeError, match="db down"):
+        sync_now()
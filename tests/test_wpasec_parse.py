@@ -0,0 +1,63 @@
+import pytest
+
+from backend.services.wpasec_sync import parse_pot_line, parse_pot_lines
+
+AP = "AA:BB:CC:DD:EE:FF"
+STA = "11:22:33:44:55:66"
+
+LINES = [
+    "aabbccddeeff:112233445566:net:password",
+    "aabbccddeeff:112233445566:my:net:password",
+    "0123456789abcdef0123456789abcdef:aabbccddeeff:112233445566:net:pass:word",
+    "0123456789abcdef:aabbccddeeff:112233445566:net:password",
+    "AABBCCDDEEFF:112233445566::password\r",
+    "aabbccddeeff:112233445566:net:",
+    "aabbccddeeff:nothex:net:password",
+    "WPA*02*aabbccddeeff*112233445566:pass",
+    "WPA*02*aabbccddeeff*112233445566*6e6574:pa*ss:w",
+    "WPA*01*PMKID*aabbccddeeff*112233445566*6e6574:pass",
+    "WPA*01*0123456789abcdef0123456789abcdef*aabbccddeeff*112233445566*6e6574***:pass",
+    "WPA*02*aabbccddeeff:pass",
+    "WPA*03*aabbccddeeff*112233445566*6e6574:pass",
+    "x AP=aabbccddeeff y:pass",
+    "bssid=aabbccddeeff:pass",
+    "# AP=aabbccddeeff:pass",
+    "",
+    "garbage",
+]
+
+
+@pytest.mark.parametrize(
+    "line, expected",
+    [
+        ("WPA*02*aabbccddeeff*112233445566*ESSID:pa*ss", (AP, "pa*ss")),
+        ("WPA*02*aabbccddeeff*112233445566:p*a*s*s", (AP, "p*a*s*s")),
+        ("WPA*01*PMKID*aabbccddeeff*112233445566*6e6574:pass:word", (AP, "pass:word")),
+        ("WPA*03*aabbccddeeff*112233445566*6e6574:pass", None),
+        ("WPA*02*aabbccddeeff*112233445566*6e6574:", None),
+    ],
+)
+def test_wpa_star(line, expected):
+    assert parse_pot_line(line) == expected
+
+
+@pytest.mark.parametrize(
+    "line, expected",
+    [
+        ("aabbccddeeff:112233445566:my:net:password", (AP, "net:password")),
+        ("0123456789abcdef0123456789abcdef:aabbccddeeff:112233445566:n:p:w", (AP, "p:w")),
+        ("aabbccddeeff:nothex:net:password", None),
+        ("WPA*02*aabbccddeeff*112233445566:pass", (AP, "pass")),
+        ("bssid=aabbccddeeff:pass", (AP, "pass")),
+        ("# AP=aabbccddeeff:pass", None),
+    ],
+)
+def test_colon_rule(line, expected):
+    assert parse_pot_line(line) == expected
+
+
+@pytest.mark.parametrize("line", LINES)
+def test_bulk_and_line_parsers_agree(line):
+    best = parse_pot_lines([line.encode()], {})
+    parsed = parse_pot_line(line)
+    assert best == (dict([parsed]) if parsed else {})
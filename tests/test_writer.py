@@ -0,0 +1,35 @@
+import asyncio
+
+from backend.db import writer
+from backend.db.writer import insert_network_record_async
+
+
+def _row(i: int) -> dict:
+    return dict(ssid=f"writer{i}", hash_type=None, hash_variant=None,
+                bssid="AA:BB:CC:EE:00:%02X" % i, vendor=None,
+                date="2024-03-01", time="00:00:00",
+                lat=None, lon=None, alt=None, accuracy=None, password=None)
+
+
+def test_inserts_are_batched():
+    async def main():
+        writer.start_writer()
+        try:
+            return await asyncio.gather(*(insert_network_record_async(**_row(i)) for i in range(5)))
+        finally:
+            await writer.stop_writer()
+
+    ids = asyncio.run(main())
+    assert len(set(ids)) == 5 and all(i > 0 for i in ids)
+
+
+def test_insert_during_shutdown_does_not_hang():
+    async def main():
+        writer.start_writer()
+        stop = asyncio.create_task(writer.stop_writer())
+        await asyncio.sleep(0)  # stop_writer ha già messo la sentinella
+        new_id = await asyncio.wait_for(insert_network_record_async(**_row(99)), 5)
+        await stop
+        return new_id
+
+    assert asyncio.run(main()) > 0